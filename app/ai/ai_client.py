@@ -1,173 +1,410 @@
-from collections.abc import AsyncGenerator
-import inspect
+from collections.abc import AsyncGenerator, AsyncIterator
+import asyncio
+from contextlib import aclosing
 from dataclasses import asdict
 import json
+import time
 from typing import Any
 import httpx
 
-from app.models.schema import Message
+from app import telemetry
+from app.ai.failover import Endpoint, UpstreamError, backoff_delay, get_endpoints
+from app.ai.response_cache import ResponseCache
+from app.ai.scheduler import Priority
+from app.ai.sse import SSEDecoder
+from app.ai.tool_runner import ToolRunner
+from app.companion.token_budget import estimate_tokens
+from app.models.schema import CompanionConfig, Message
+
+
+request_seconds = telemetry.histogram("furina_llm_request_seconds", "Total upstream request time")
+ttft_seconds = telemetry.histogram("furina_llm_ttft_seconds", "Time to first streamed token")
+connect_seconds = telemetry.histogram("furina_llm_connect_seconds", "TCP/TLS connection setup time")
+tokens_total = telemetry.counter("furina_tokens_total", "Estimated prompt and completion tokens")
+cache_lookups_total = telemetry.counter("furina_cache_lookups_total", "Response cache lookups by result")
+
+
+def _connection_trace(endpoint: Endpoint) -> dict[str, Any]:
+    if not telemetry.enabled():
+        return {}
+
+    started: dict[str, float] = {}
+
+    async def trace(event: str, info: dict[str, Any]):
+        if event.endswith(".started"):
+            started[event[:-8]] = time.perf_counter()
+        elif event.endswith(".complete"):
+            name = event[:-9]
+            if name in ("connection.connect_tcp", "connection.start_tls") and name in started:
+                phase = "tcp" if name.endswith("tcp") else "tls"
+                connect_seconds.observe(time.perf_counter() - started[name], endpoint=endpoint.url, phase=phase)
+
+    return {"trace": trace}
+
+
+async def _sse_events(response: httpx.Response, decoder: SSEDecoder) -> AsyncIterator[str]:
+    async for text in response.aiter_text():
+        for event in decoder.feed(text):
+            yield event
+    # A last event without its blank-line terminator, or a stream that ends
+    # without [DONE], is still delivered.
+    for event in decoder.flush():
+        yield event
+
+
+def _merge_tool_call(old: dict[str, Any], new: dict[str, Any]) -> dict[str, Any]:
+    merged = old.copy()
+    merged_function = merged.get("function", {})
+    new_function = new.get("function", {})
+
+    if "name" in new_function:
+        merged_function["name"] = new_function["name"]
+    if "arguments" in new_function:
+        merged_function["arguments"] = merged_function.get("arguments", "") + new_function["arguments"]
+
+    merged["function"] = merged_function
+    return merged
 
 
 class AIClient:
-    def __init__(self, api_url: str, api_key: str, tool_registry: Any, tools: list[dict[str, Any]]) -> None:
-        self.api_url = api_url
-        self.api_key = api_key
+    def __init__(
+            self,
+            conf: CompanionConfig,
+            tool_registry: Any,
+            tools: list[dict[str, Any]],
+            cache: ResponseCache | None = None
+    ) -> None:
+        self.conf = conf
+        self.endpoints: list[Endpoint] = get_endpoints(conf)
         self.tools = tools
         self.registry = tool_registry
-
-    async def post_messages_stream(self, messages: list[Message], max_tokens: int) -> AsyncGenerator[str, None]:
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
+        self.tool_runner = ToolRunner(conf, tool_registry)
+        self.cache = cache
+        self.stream_timeout = httpx.Timeout(conf.http_stream_timeout, connect=conf.http_connect_timeout)
+
+    def _make_payload(
+            self,
+            endpoint: Endpoint,
+            msgs: list[dict[str, Any]],
+            max_tokens: int,
+            stream: bool,
+            allow_tools: bool
+    ):
+        payload = {
+            "max_tokens": max_tokens,
+            "model": endpoint.model,
+            "messages": msgs,
+            "tools": self.tools if self.tools and allow_tools else None
         }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def _estimate_tokens(self, msgs: list[dict[str, Any]], max_tokens: int) -> int:
+        chars = sum(len(m["content"]) for m in msgs if isinstance(m.get("content"), str))
+        return chars // 4 + max_tokens
+
+    def _pick_endpoint(self, attempt: int) -> Endpoint | None:
+        count = len(self.endpoints)
+        for i in range(count):
+            endpoint = self.endpoints[(attempt + i) % count]
+            if endpoint.breaker.allow():
+                return endpoint
+        return None
+
+    async def _post(
+            self,
+            endpoint: Endpoint,
+            msgs: list[dict[str, Any]],
+            max_tokens: int,
+            allow_tools: bool,
+            priority: Priority
+    ) -> dict[str, Any]:
+        payload = self._make_payload(endpoint, msgs, max_tokens, False, allow_tools)
+        async with endpoint.scheduler.slot(priority, self._estimate_tokens(msgs, max_tokens)):
+            start = time.monotonic()
+            with telemetry.span("llm.request", endpoint=endpoint.url, stream=False):
+                try:
+                    response = await endpoint.http.post(
+                        endpoint.url, headers=endpoint.headers, json=payload, extensions=_connection_trace(endpoint)
+                    )
+                    endpoint.check(response)
+                except (httpx.TransportError, UpstreamError):
+                    endpoint.breaker.record_failure()
+                    raise
+                except httpx.HTTPStatusError:
+                    endpoint.breaker.record_success()
+                    raise
+                except BaseException:
+                    endpoint.breaker.release()
+                    raise
+
+        endpoint.latency.record(time.monotonic() - start)
+        request_seconds.observe(time.monotonic() - start, endpoint=endpoint.url, stream=False)
+        endpoint.breaker.record_success()
+        return response.json()["choices"][0]["message"]
+
+    async def _post_hedged(
+            self,
+            endpoint: Endpoint,
+            attempt: int,
+            msgs: list[dict[str, Any]],
+            max_tokens: int,
+            allow_tools: bool,
+            priority: Priority
+    ) -> dict[str, Any]:
+        delay = endpoint.latency.p95() or self.conf.hedge_delay
+        first = asyncio.create_task(self._post(endpoint, msgs, max_tokens, allow_tools, priority))
+        pending: set[asyncio.Task[dict[str, Any]]] = {first}
+
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return first.result()
+
+            hedge = self._pick_endpoint(attempt + 1) or endpoint
+            print(f"[AI CLIENT] No answer from {endpoint.url} after {delay:.2f}s, hedging on {hedge.url}")
+            pending.add(asyncio.create_task(self._post(hedge, msgs, max_tokens, allow_tools, priority)))
+
+            error: BaseException | None = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            assert error is not None
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _request(
+            self,
+            msgs: list[dict[str, Any]],
+            max_tokens: int,
+            allow_tools: bool,
+            assistant: dict[str, Any],
+            priority: Priority
+    ) -> AsyncGenerator[str, None]:
+        message_data = None
+        last_error: Exception | None = None
+
+        for attempt in range(self.conf.max_retries + 1):
+            endpoint = self._pick_endpoint(attempt)
+            if endpoint is None:
+                break
+            if attempt:
+                await asyncio.sleep(backoff_delay(attempt - 1, self.conf.retry_base_delay, self.conf.retry_max_delay))
 
-        def merge_tool_call(old, new):
-            merged = old.copy()
-            merged_function = merged.get("function", {})
-            new_function = new.get("function", {})
-
-            if "name" in new_function:
-                merged_function["name"] = new_function["name"]
-            if "arguments" in new_function:
-                merged_function["arguments"] = merged_function.get("arguments", "") + new_function["arguments"]
-
-            merged["function"] = merged_function
-            return merged
-
-        def make_payload(msgs):
-            return {
-                "max_tokens": max_tokens,
-                "model": "deepseek-chat",
-                "stream": True,
-                "messages": [asdict(m) if isinstance(m, Message) else m for m in msgs],
-                "tools": self.tools if self.tools else None
-            }
-
-        async def stream_and_handle(msgs):
-            tool_calls = []
-            collecting_tool_calls = False
-
-            async with httpx.AsyncClient(timeout=None) as client:
-                async with client.stream("POST", self.api_url, headers=headers, json=make_payload(msgs)) as response:
-                    async for line in response.aiter_lines():
-                        if line:
-                            if line.startswith("data: "):
-                                line = line[6:]
-                            if line.strip() == "[DONE]":
-                                break
-
-                            try:
-                                chunk = json.loads(line)
-                                choice = chunk["choices"][0]
-                                delta = choice.get("delta", {})
-
-                                if "tool_calls" in delta:
-                                    collecting_tool_calls = True
+            try:
+                if self.conf.hedge_requests:
+                    message_data = await self._post_hedged(
+                        endpoint, attempt, msgs, max_tokens, allow_tools, priority
+                    )
+                else:
+                    message_data = await self._post(endpoint, msgs, max_tokens, allow_tools, priority)
+                break
+            except (httpx.TransportError, UpstreamError) as e:
+                last_error = e
+                print(f"[AI CLIENT] [WARN] Attempt {attempt + 1} on {endpoint.url} failed: {e}")
+
+        if message_data is None:
+            raise UpstreamError("All AI endpoints failed or are unavailable") from last_error
+
+        assistant.update(message_data)
+        if message_data.get("content") and not message_data.get("tool_calls"):
+            yield message_data["content"]
+
+    async def _request_stream(
+            self,
+            msgs: list[dict[str, Any]],
+            max_tokens: int,
+            allow_tools: bool,
+            assistant: dict[str, Any],
+            priority: Priority
+    ) -> AsyncGenerator[str, None]:
+        last_error: Exception | None = None
+
+        for attempt in range(self.conf.max_retries + 1):
+            endpoint = self._pick_endpoint(attempt)
+            if endpoint is None:
+                break
+            if attempt:
+                await asyncio.sleep(backoff_delay(attempt - 1, self.conf.retry_base_delay, self.conf.retry_max_delay))
+
+            decoder = SSEDecoder()
+            tool_calls: list[dict[str, Any]] = []
+            content: list[str] = []
+            started = False
+
+            try:
+                slot = endpoint.scheduler.slot(priority, self._estimate_tokens(msgs, max_tokens))
+                async with slot:
+                    # The clock starts once the slot is ours, so TTFT covers connect and send but not queueing.
+                    start = time.monotonic()
+                    async with endpoint.http.stream(
+                        "POST",
+                        endpoint.url,
+                        headers=endpoint.headers,
+                        json=self._make_payload(endpoint, msgs, max_tokens, True, allow_tools),
+                        timeout=self.stream_timeout,
+                        extensions=_connection_trace(endpoint)
+                    ) as response:
+                        if response.status_code >= 400:
+                            await response.aread()
+                            endpoint.check(response)
+
+                        async with aclosing(_sse_events(response, decoder)) as events:
+                            async for event in events:
+                                if event.strip() == "[DONE]":
+                                    break
+
+                                try:
+                                    chunk = json.loads(event)
+                                except json.JSONDecodeError as e:
+                                    print(f"[AI CLIENT] [STREAM ERROR] Invalid event: {e}")
+                                    continue
+
+                                choices = chunk.get("choices")
+                                if not choices:
+                                    continue
+                                delta = choices[0].get("delta") or {}
+
+                                if delta.get("tool_calls"):
+                                    started = True
                                     for tc in delta["tool_calls"]:
                                         index = tc["index"]
                                         if len(tool_calls) <= index:
                                             tool_calls.append(tc)
                                         else:
-                                            tool_calls[index] = merge_tool_call(tool_calls[index], tc)
-
-                                elif "content" in delta and not collecting_tool_calls:
+                                            tool_calls[index] = _merge_tool_call(tool_calls[index], tc)
+                                elif delta.get("content") and not tool_calls:
+                                    if not started:
+                                        started = True
+                                        endpoint.ttft.record(time.monotonic() - start)
+                                        ttft_seconds.observe(time.monotonic() - start, endpoint=endpoint.url)
+                                    content.append(delta["content"])
                                     yield delta["content"]
-
-                                if choice.get("finish_reason") == "tool_calls":
-                                    tool_messages = []
-                                    assistant_msg = {
-                                        "role": "assistant",
-                                        "tool_calls": tool_calls
-                                    }
-                                    msgs.append(assistant_msg)
-
-                                    for call in tool_calls:
-                                        fn_name = call["function"]["name"]
-                                        arguments = json.loads(call["function"]["arguments"])
-                                        call_id = call["id"]
-
-                                        tool_output = await self.run_tool(fn_name, arguments)
-                                        tool_messages.append({
-                                            "role": "tool",
-                                            "tool_call_id": call_id,
-                                            "content": tool_output
-                                        })
-
-                                    msgs.extend(tool_messages)
-
-                                    async for item in stream_and_handle(msgs):
-                                        yield item
-                                    return
-
-                            except Exception as e:
-                                print(f"[AI CLIENT] [STREAM ERROR] {e}")
-
-        async for item in stream_and_handle(messages):
-            yield item
-
-    async def post_messages(self, messages: list[Message], max_tokens: int) -> str:
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-
-        data = {
-            "max_tokens": max_tokens,
-            "model": "deepseek-chat",
-            "messages": [
-                asdict(m) if isinstance(m, Message) else m
-                for m in messages
-            ],
-            "tools": self.tools if self.tools else None
-        }
-
-        async with httpx.AsyncClient(timeout=120) as client:
-            try:
-                response = await client.post(self.api_url, headers=headers, json=data)
-                response_json = response.json()
-                message_data = response_json["choices"][0]["message"]
-
-                if "tool_calls" in message_data:
-                    tool_messages = []
-                    for tool_call in message_data["tool_calls"]:
-                        function_name = tool_call["function"]["name"]
-                        arguments = json.loads(tool_call["function"]["arguments"])
-                        tool_call_id = tool_call["id"]
-
-                        tool_result = await self.run_tool(function_name, arguments)
-
-                        tool_messages.append({
-                            "role": "tool",
-                            "tool_call_id": tool_call_id,
-                            "content": tool_result
-                        })
-
-                    new_messages = messages.copy()
-                    new_messages.append(message_data)
-                    new_messages.extend(tool_messages)
-
-                    return await self.post_messages(new_messages, max_tokens)
-
-                return message_data["content"]
-            except httpx.RequestError as e:
-                print("[AI CLIENT] [ERROR] ", e)
+            except (httpx.TransportError, UpstreamError) as e:
+                endpoint.breaker.record_failure()
+                if started:
+                    raise
+                last_error = e
+                print(f"[AI CLIENT] [WARN] Stream attempt {attempt + 1} on {endpoint.url} failed: {e}")
+                continue
+            except httpx.HTTPStatusError:
+                endpoint.breaker.record_success()
                 raise
+            except BaseException:
+                endpoint.breaker.release()
+                raise
+
+            endpoint.breaker.record_success()
+            request_seconds.observe(time.monotonic() - start, endpoint=endpoint.url, stream=True)
+            assistant["content"] = "".join(content) if content else None
+            if tool_calls:
+                assistant["tool_calls"] = tool_calls
+            return
+
+        raise UpstreamError("All AI endpoints failed or are unavailable") from last_error
+
+    async def _run(
+            self,
+            messages: list[dict[str, Any]],
+            max_tokens: int,
+            stream: bool,
+            state: dict[str, Any],
+            priority: Priority
+    ) -> AsyncGenerator[str, None]:
+        msgs = list(messages)
+        request = self._request_stream if stream else self._request
+
+        for round in range(self.conf.max_tool_rounds + 1):
+            allow_tools = round < self.conf.max_tool_rounds
+            assistant: dict[str, Any] = {"role": "assistant"}
+
+            async for chunk in request(msgs, max_tokens, allow_tools, assistant, priority):
+                yield chunk
+
+            tool_calls = assistant.get("tool_calls")
+            if not tool_calls:
+                return
+
+            if not allow_tools:
+                print(f"[AI CLIENT] [WARN] Tool round limit ({self.conf.max_tool_rounds}) reached")
+                return
+
+            state["tool_rounds"] += 1
+            msgs.append(assistant)
+            msgs.extend(await self.tool_runner.run_calls(tool_calls))
+
+    async def _complete(
+            self,
+            messages: list[Message],
+            max_tokens: int,
+            stream: bool,
+            use_cache: bool,
+            priority: Priority,
+            query: str | None = None
+    ) -> AsyncGenerator[str, None]:
+        msgs = [asdict(m) if isinstance(m, Message) else m for m in messages]
+
+        lookup = None
+        if self.cache is not None and use_cache:
+            upstream = [(endpoint.url, endpoint.model) for endpoint in self.endpoints]
+            lookup = await self.cache.lookup(msgs, self.tools, max_tokens, query, upstream)
+            cache_lookups_total.inc(result="miss" if lookup.response is None else "hit")
+            if lookup.response is not None:
+                yield lookup.response
+                return
+
+        state: dict[str, Any] = {"tool_rounds": 0}
+        parts: list[str] = []
+        with telemetry.span("llm.complete", companion=self.conf.ai_name, stream=stream) as span:
+            async for chunk in self._run(msgs, max_tokens, stream, state, priority):
+                parts.append(chunk)
+                yield chunk
+            span.set("tool_rounds", state["tool_rounds"])
+
+        if telemetry.enabled():
+            prompt = sum(estimate_tokens(m["content"]) for m in msgs if isinstance(m.get("content"), str))
+            tokens_total.inc(prompt, companion=self.conf.ai_name, kind="prompt")
+            tokens_total.inc(estimate_tokens("".join(parts)), companion=self.conf.ai_name, kind="completion")
+
+        if self.cache is not None and lookup is not None and parts and state["tool_rounds"] == 0:
+            self.cache.store(lookup, "".join(parts))
+
+    async def post_messages_stream(
+            self,
+            messages: list[Message],
+            max_tokens: int,
+            use_cache: bool = True,
+            priority: Priority = Priority.INTERACTIVE_STREAM,
+            query: str | None = None
+    ) -> AsyncGenerator[str, None]:
+        async for chunk in self._complete(messages, max_tokens, True, use_cache, priority, query):
+            yield chunk
+
+    async def post_messages(
+            self,
+            messages: list[Message],
+            max_tokens: int,
+            use_cache: bool = True,
+            priority: Priority = Priority.INTERACTIVE,
+            query: str | None = None
+    ) -> str:
+        try:
+            return "".join([
+                chunk async for chunk in self._complete(messages, max_tokens, False, use_cache, priority, query)
+            ])
+        except (httpx.HTTPError, UpstreamError) as e:
+            print("[AI CLIENT] [ERROR] ", e)
+            raise
 
     async def run_tool(self, name: str, args: dict[str, Any]) -> str:
-        tool = self.registry.get(name)
-        if not tool:
-            return f"[AI CLIENT] [Error] Tool '{name}' not found"
-
-        if hasattr(tool, "run") and callable(tool.run):
-            log = f"[AI CLIENT] Running [{name}] with ("
-            for k, v in args.items():
-                log += f"\n    {k}={v}"
-            if args:
-                log += "\n"
-            log += ")"
-            print(log)
-            if inspect.iscoroutinefunction(tool.run):
-                return await tool.run(args)
-            return tool.run(args)
-
-        return "[AI CLIENT] [Error] Invalid tool"
+        return await self.tool_runner.run(name, args)
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.close()
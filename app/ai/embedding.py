@@ -0,0 +1,247 @@
+import asyncio
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import resource
+import threading
+import time
+from typing import Any
+import chromadb
+import numpy as np
+from chromadb.api import ClientAPI
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings, Space
+from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+from overrides import final
+
+from app.ai.onnx_embedding import OnnxEmbeddingFunction
+
+
+def _rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@final
+class EmbeddingService(EmbeddingFunction[Documents]):
+    def __init__(
+            self,
+            model_name: str = "all-MiniLM-L6-v2",
+            device: str = "cpu",
+            backend: str = "torch",
+            cache_size: int = 4096,
+            batch_window: float = 0.005,
+            max_batch: int = 64
+    ) -> None:
+        self.model_name = model_name
+        self.device = device
+        self.backend = backend
+        self._function: Callable[[Documents], Embeddings] | None = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+        self.cache_size = cache_size
+        self._cache: OrderedDict[bytes, np.ndarray] = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="furina-embedding")
+        self._pending: list[tuple[list[str], asyncio.Future[list[np.ndarray]]]] = []
+        self._pending_count = 0
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self.batches = 0
+        self.batched_texts = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def _create_function(self) -> Callable[[Documents], Embeddings]:
+        if self.backend == "torch":
+            return SentenceTransformerEmbeddingFunction(self.model_name, device=self.device)
+        if self.backend in ("onnx", "onnx-int8"):
+            return OnnxEmbeddingFunction(self.model_name, quantized=self.backend == "onnx-int8")
+        raise ValueError(f"[EMBEDDING] Unknown embedding backend '{self.backend}', expected 'torch', 'onnx' or 'onnx-int8'")
+
+    def load(self) -> Callable[[Documents], Embeddings]:
+        if self._function is not None:
+            return self._function
+
+        with self._lock:
+            if self._function is None:
+                start = time.perf_counter()
+                rss_before = _rss_mb()
+                self._function = self._create_function()
+                self._ready.set()
+                print(
+                    f"[EMBEDDING] Loaded {self.model_name} ({self.backend}) in {time.perf_counter() - start:.2f}s "
+                    f"(peak RSS {rss_before:.0f} MB -> {_rss_mb():.0f} MB)"
+                )
+        return self._function
+
+    def _cached(self, texts: list[str], record: bool = True) -> list[np.ndarray | None]:
+        found: list[np.ndarray | None] = []
+        with self._cache_lock:
+            for text in texts:
+                key = hashlib.sha1(text.encode()).digest()
+                vector = self._cache.get(key)
+                if vector is not None:
+                    self._cache.move_to_end(key)
+                if record:
+                    if vector is not None:
+                        self.hits += 1
+                    else:
+                        self.misses += 1
+                found.append(vector)
+        return found
+
+    def embed(self, texts: list[str], record: bool = True) -> list[np.ndarray]:
+        vectors = self._cached(texts, record)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if not missing:
+            return vectors  # type: ignore[return-value]
+
+        computed = {
+            text: np.asarray(vector, dtype=np.float32)
+            for text, vector in zip(missing, self.load()(missing))
+        }
+        with self._cache_lock:
+            for text, vector in computed.items():
+                self._cache[hashlib.sha1(text.encode()).digest()] = vector
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return [v if v is not None else computed[t] for t, v in zip(texts, vectors)]
+
+    async def aembed(self, texts: list[str]) -> list[np.ndarray]:
+        vectors = self._cached(texts)
+        if all(v is not None for v in vectors):
+            return vectors  # type: ignore[return-value]
+
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[list[np.ndarray]] = loop.create_future()
+        self._pending.append((texts, future))
+        self._pending_count += len(texts)
+
+        if self._pending_count >= self.max_batch:
+            self._flush(loop)
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush, loop)
+        return await future
+
+    def _flush(self, loop: asyncio.AbstractEventLoop):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch = [(texts, future) for texts, future in self._pending if not future.done()]
+        self._pending = []
+        self._pending_count = 0
+        if not batch:
+            return
+
+        texts = list(dict.fromkeys(t for ts, _ in batch for t in ts))
+        self.batches += 1
+        self.batched_texts += len(texts)
+        job = loop.run_in_executor(self._pool, self.embed, texts, False)
+
+        def resolve(job: asyncio.Future[list[np.ndarray]]):
+            if job.cancelled() or job.exception() is not None:
+                error = job.exception() if not job.cancelled() else asyncio.CancelledError()
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)  # type: ignore[arg-type]
+                return
+
+            vectors = dict(zip(texts, job.result()))
+            for ts, future in batch:
+                if not future.done():
+                    future.set_result([vectors[t] for t in ts])
+
+        job.add_done_callback(resolve)
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "batches": self.batches,
+            "avg_batch": self.batched_texts / self.batches if self.batches else 0.0
+        }
+
+    def warm_up(self) -> threading.Thread:
+        def run():
+            try:
+                self.load()(["warm up"])
+            except Exception as e:
+                print(f"[EMBEDDING] [ERROR] Warm-up failed: {e}")
+
+        thread = threading.Thread(target=run, name="furina-embedding-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def __call__(self, input: Documents) -> Embeddings:
+        return self.embed(list(input))
+
+    @staticmethod
+    def name() -> str:
+        return "sentence_transformer"
+
+    def default_space(self) -> Space:
+        return "cosine"
+
+    def get_config(self) -> dict[str, Any]:
+        return {
+            "model_name": self.model_name,
+            "device": self.device,
+            "normalize_embeddings": False,
+            "kwargs": {}
+        }
+
+    @staticmethod
+    def build_from_config(config: dict[str, Any]) -> "EmbeddingService":
+        return get_embedding_service(config["model_name"], config.get("device", "cpu"))
+
+
+_services: dict[tuple[str, str, str], EmbeddingService] = {}
+_clients: dict[str, ClientAPI] = {}
+
+
+def get_embedding_service(
+        model_name: str = "all-MiniLM-L6-v2",
+        device: str = "cpu",
+        backend: str = "torch",
+        **options: Any
+) -> EmbeddingService:
+    key = (model_name, device, backend)
+    service = _services.get(key)
+    if service is None:
+        service = _services[key] = EmbeddingService(model_name, device, backend, **options)
+    return service
+
+
+CHROMA_SERVERS_ENV = "FURINA_CHROMA_SERVERS"
+
+
+def get_chroma_client(path: str) -> ClientAPI:
+    # Worker processes reach the store through the supervisor's Chroma server,
+    # which is the only process that opens `path` directly.
+    client = _clients.get(path)
+    if client is None:
+        server = json.loads(os.environ.get(CHROMA_SERVERS_ENV, "{}")).get(path)
+        if server is not None:
+            host, port = server.rsplit(":", 1)
+            client = _clients[path] = chromadb.HttpClient(host=host, port=int(port))
+        else:
+            client = _clients[path] = chromadb.PersistentClient(path)
+    return client
+
+
+def warm_up_embeddings() -> list[threading.Thread]:
+    return [service.warm_up() for service in _services.values() if not service.ready]
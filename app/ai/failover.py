@@ -0,0 +1,117 @@
+from collections import deque
+import random
+import time
+import httpx
+from overrides import final
+
+from app.ai.http_pool import get_http_client
+from app.ai.scheduler import RequestScheduler, get_scheduler
+from app.models.schema import CompanionConfig, EndpointConfig
+
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    pass
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+@final
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probe_at = 0.0
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        now = time.monotonic()
+        if self.state == "open" and now - self.opened_at >= self.reset_timeout:
+            self.state = "half-open"
+            self.probe_at = now
+            return True
+        if self.state == "half-open" and now - self.probe_at >= self.reset_timeout:
+            # The previous trial never reported back; admit another one.
+            self.probe_at = now
+            return True
+        return False
+
+    def release(self):
+        # A trial that ended without an upstream verdict (cancelled, or failed
+        # locally) hands the probe back so the next caller can try at once.
+        if self.state == "half-open":
+            self.state = "open"
+            self.opened_at = time.monotonic() - self.reset_timeout
+
+    def record_success(self):
+        self.failures = 0
+        self.state = "closed"
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half-open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+@final
+class LatencyTracker:
+    def __init__(self, size: int = 200, min_samples: int = 20) -> None:
+        self.samples: deque[float] = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def p95(self) -> float | None:
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+
+@final
+class Endpoint:
+    def __init__(self, conf: CompanionConfig, endpoint: EndpointConfig) -> None:
+        self.conf = conf
+        self.url = endpoint.url
+        self.model = endpoint.model
+        self.headers = {
+            "Authorization": f"Bearer {endpoint.api_key}",
+            "Content-Type": "application/json"
+        }
+        self.scheduler: RequestScheduler = get_scheduler(conf, endpoint.api_key)
+        self.breaker = CircuitBreaker(conf.breaker_failure_threshold, conf.breaker_reset_timeout)
+        self.latency = LatencyTracker()
+        self.ttft = LatencyTracker()
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        return get_http_client(self.conf, self.url)
+
+    def check(self, response: httpx.Response):
+        if response.status_code in RETRYABLE_STATUS:
+            raise UpstreamError(f"{self.url} answered {response.status_code}")
+        response.raise_for_status()
+
+
+_endpoints: dict[tuple[str, str, str], Endpoint] = {}
+
+
+def get_endpoints(conf: CompanionConfig) -> list[Endpoint]:
+    configured = conf.ai_endpoints or [EndpointConfig(conf.ai_api_url, conf.ai_api_key, conf.ai_model)]
+    endpoints: list[Endpoint] = []
+    for endpoint in configured:
+        key = (endpoint.url, endpoint.api_key, endpoint.model)
+        if key not in _endpoints:
+            _endpoints[key] = Endpoint(conf, endpoint)
+        endpoints.append(_endpoints[key])
+    return endpoints
@@ -0,0 +1,116 @@
+import time
+from typing import Any
+
+import numpy as np
+
+
+class HotIndex:
+    """Fixed-capacity in-process vector index for frequently recalled memories.
+
+    Vectors live in one contiguous float32 matrix and are searched with a single
+    matrix product. Pinned entries are never displaced; the rest of the slots are
+    admitted by recency and the least recently used unpinned entry makes room.
+    Vectors are expected to be L2-normalized, so distances match Chroma's cosine space.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.matrix: np.ndarray | None = None
+        self.size = 0
+        self.ids: list[str] = []
+        self.documents: list[str] = []
+        self.metadatas: list[dict[str, Any]] = []
+        self.pinned = np.zeros(capacity, dtype=bool)
+        self.last_used = np.zeros(capacity, dtype=np.float64)
+        self.slots: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, id: str) -> bool:
+        return id in self.slots
+
+    def _free_slot(self) -> int | None:
+        if self.size < self.capacity:
+            self.size += 1
+            self.ids.append("")
+            self.documents.append("")
+            self.metadatas.append({})
+            return self.size - 1
+
+        candidates = np.flatnonzero(~self.pinned[:self.size])
+        if candidates.size == 0:
+            return None
+        slot = int(candidates[np.argmin(self.last_used[candidates])])
+        del self.slots[self.ids[slot]]
+        return slot
+
+    def add(self, id: str, vector: Any, document: str, metadata: dict[str, Any] | None, pinned: bool = False) -> bool:
+        vector = np.asarray(vector, dtype=np.float32)
+        if self.matrix is None:
+            self.matrix = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+
+        slot = self.slots.get(id)
+        if slot is None:
+            slot = self._free_slot()
+            if slot is None:
+                return False
+            self.slots[id] = slot
+
+        self.matrix[slot] = vector
+        self.ids[slot] = id
+        self.documents[slot] = document
+        self.metadatas[slot] = dict(metadata or {})
+        self.pinned[slot] = pinned or bool(self.pinned[slot])
+        self.last_used[slot] = time.monotonic()
+        return True
+
+    def discard(self, ids: list[str]):
+        for id in ids:
+            slot = self.slots.pop(id, None)
+            if slot is None:
+                continue
+
+            last = self.size - 1
+            if slot != last:
+                assert self.matrix is not None
+                moved = self.ids[last]
+                self.matrix[slot] = self.matrix[last]
+                self.ids[slot] = moved
+                self.documents[slot] = self.documents[last]
+                self.metadatas[slot] = self.metadatas[last]
+                self.pinned[slot] = self.pinned[last]
+                self.last_used[slot] = self.last_used[last]
+                self.slots[moved] = slot
+
+            self.pinned[last] = False
+            self.last_used[last] = 0
+            self.ids.pop()
+            self.documents.pop()
+            self.metadatas.pop()
+            self.size -= 1
+
+    def search(self, queries: Any, k: int) -> list[list[dict[str, Any]]]:
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if self.matrix is None or self.size == 0 or k <= 0:
+            return [[] for _ in range(len(queries))]
+
+        scores = queries @ self.matrix[:self.size].T
+        k = min(k, self.size)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k] if k < self.size else np.tile(np.arange(self.size), (len(queries), 1))
+
+        now = time.monotonic()
+        results: list[list[dict[str, Any]]] = []
+        for row, slots in zip(scores, top):
+            slots = slots[np.argsort(-row[slots])]
+            self.last_used[slots] = now
+            results.append([
+                {
+                    "id": self.ids[slot],
+                    "document": self.documents[slot],
+                    "metadata": self.metadatas[slot],
+                    "distance": max(0.0, float(1 - row[slot]))
+                }
+                for slot in slots
+            ])
+        return results
@@ -0,0 +1,58 @@
+import importlib.util
+import httpx
+
+from app.models.schema import CompanionConfig
+
+
+_clients: dict[tuple, httpx.AsyncClient] = {}
+
+
+def _pool_key(conf: CompanionConfig, url: str) -> tuple:
+    origin = httpx.URL(url)
+    return (
+        origin.scheme,
+        origin.host,
+        origin.port,
+        conf.http2,
+        conf.http_max_connections,
+        conf.http_max_keepalive_connections,
+        conf.http_keepalive_expiry,
+        conf.http_connect_timeout,
+        conf.http_timeout
+    )
+
+
+def get_http_client(conf: CompanionConfig, url: str | None = None) -> httpx.AsyncClient:
+    url = url or conf.ai_api_url
+    key = _pool_key(conf, url)
+    client = _clients.get(key)
+    if client is not None and not client.is_closed:
+        return client
+
+    http2 = conf.http2
+    if http2 and importlib.util.find_spec("h2") is None:
+        print(f"[HTTP] [WARN] [{conf.ai_name}] http2 enabled but 'h2' is not installed, falling back to HTTP/1.1")
+        http2 = False
+
+    client = httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=conf.http_max_connections,
+            max_keepalive_connections=conf.http_max_keepalive_connections,
+            keepalive_expiry=conf.http_keepalive_expiry
+        ),
+        timeout=httpx.Timeout(conf.http_timeout, connect=conf.http_connect_timeout)
+    )
+    _clients[key] = client
+    print(f"[HTTP] Opened pool for {url} (http2={http2}, max_connections={conf.http_max_connections})")
+    return client
+
+
+async def close_http_clients():
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        if not client.is_closed:
+            await client.aclose()
+    if clients:
+        print(f"[HTTP] Closed {len(clients)} connection pool{'s' if len(clients) > 1 else ''}.")
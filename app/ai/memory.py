@@ -1,53 +1,193 @@
+import asyncio
+from collections import Counter
+from collections.abc import AsyncIterator, Callable
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import hashlib
+import json
+import time
+from typing import Any, TypeVar
 import chromadb
 from uuid import uuid4
-from chromadb.api.types import Embeddable
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
 from overrides import final
 
+from app import telemetry
+from app.ai.embedding import EmbeddingService, get_chroma_client, get_embedding_service
+from app.ai.hot_index import HotIndex
 from app.models.schema import CompanionConfig, MemoryEntry
 
 
+T = TypeVar("T")
+
+
+def content_hash(entry: MemoryEntry) -> str:
+    payload = json.dumps([entry.document, entry.metadata or {}], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+recalls_total = telemetry.counter("furina_memory_recalls_total", "Knowledge lookups by the tier that answered them")
+
+
+@final
+class MemoryExecutor:
+    def __init__(self, workers: int, queue_size: int) -> None:
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="furina-memory")
+        self.slots = asyncio.Semaphore(workers + queue_size)
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        await self.slots.acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            future = self.pool.submit(partial(fn, *args, **kwargs))
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self.slots.release))
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+_executor: MemoryExecutor | None = None
+
+
+def get_memory_executor(conf: CompanionConfig) -> MemoryExecutor:
+    global _executor
+    if _executor is None:
+        _executor = MemoryExecutor(conf.memory_workers, conf.memory_queue_size)
+    return _executor
+
+
+def shutdown_memory_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+
+
 @final
 class Memory:
     def __init__(self, conf: CompanionConfig, memories: list[MemoryEntry]) -> None:
         self.conf = conf
         self.memories = memories
+        self.executor = get_memory_executor(conf)
 
-        embedding_func: chromadb.EmbeddingFunction[
-            chromadb.Documents | Embeddable
-        ] = SentenceTransformerEmbeddingFunction(
-            "all-MiniLM-L6-v2"
+        self.embedding_func: EmbeddingService = get_embedding_service(
+            conf.embedding_model,
+            backend=conf.embedding_backend,
+            cache_size=conf.embedding_cache_size,
+            batch_window=conf.embedding_batch_window,
+            max_batch=conf.embedding_max_batch
         )
+        self.client = get_chroma_client(conf.chroma_path)
 
-        self.client = chromadb.PersistentClient()
+        self._pending: list[tuple[str, str, dict[str, Any]]] = []
+        self._in_flight = 0
+        self._flush_lock = asyncio.Lock()
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._flush_tasks: set[asyncio.Task[None]] = set()
+        self._recalls: Counter[str] = Counter()
+        self.count = 0
+        self.hot = HotIndex(conf.hot_tier_size) if conf.hot_tier_size > 0 else None
         self.collection = self.client.get_or_create_collection( 
             self.conf.collection_name,
-            embedding_function=embedding_func
+            embedding_function=self.embedding_func
         )
 
-        count = self.collection.count()
-        print(f"[MEMORY] [{self.conf.ai_name}] Found {count} memories in database.")
+    async def start(self, sync: bool = True):
+        self.count = await self.executor.run(self.collection.count)
+        print(f"[MEMORY] [{self.conf.ai_name}] Found {self.count} memories in database.")
+
+        if sync:
+            await self.sync_base_memories()
+        await self.pin_long_term()
 
-        if count == 0:
-            print(f"[MEMORY] [{self.conf.ai_name}] No memories found, importing base memories...")
-            self.load_memories()
+    async def sync_base_memories(self):
+        configured = {m.id: m for m in self.memories}
+        stored: dict[str, tuple[str | None, dict[str, Any]]] = {}
+        if configured:
+            found = await self.aget(ids=list(configured), include=["documents", "metadatas"])
+            stored = {
+                id: (document, dict(metadata or {}))
+                for id, document, metadata in zip(found["ids"], found["documents"], found["metadatas"])
+            }
 
-    def load_memories(self):
-        for memory in self.memories:
-            self.collection.upsert(
-                memory.id,
-                documents=memory.document,
-                metadatas=memory.metadata
+        added: list[tuple[MemoryEntry, dict[str, Any]]] = []
+        rewritten: list[tuple[MemoryEntry, dict[str, Any]]] = []
+        relabelled: list[tuple[MemoryEntry, dict[str, Any]]] = []
+        for id, entry in configured.items():
+            digest = content_hash(entry)
+            metadata = {**(entry.metadata or {}), "base": True, "content_hash": digest}
+            if id not in stored:
+                added.append((entry, metadata))
+            elif stored[id][1].get("content_hash") == digest:
+                continue
+            elif stored[id][0] == entry.document:
+                relabelled.append((entry, metadata))
+            else:
+                rewritten.append((entry, metadata))
+
+        batch = self.conf.memory_page_size
+        for changes, write in ((added, self.collection.upsert), (rewritten, self.collection.update)):
+            for i in range(0, len(changes), batch):
+                chunk = changes[i:i + batch]
+                documents = [entry.document for entry, _ in chunk]
+                await self.executor.run(
+                    write,
+                    ids=[entry.id for entry, _ in chunk],
+                    documents=documents,
+                    embeddings=await self.embedding_func.aembed(documents),
+                    metadatas=[metadata for _, metadata in chunk]
+                )
+        for i in range(0, len(relabelled), batch):
+            chunk = relabelled[i:i + batch]
+            await self.executor.run(
+                self.collection.update,
+                ids=[entry.id for entry, _ in chunk],
+                metadatas=[metadata for _, metadata in chunk]
             )
-        print(f"[MEMORY] [{self.conf.ai_name}] Loaded {len(self.memories)} memories.")
+        self.forget_cached([entry.id for entry, _ in rewritten + relabelled])
+
+        pruned: list[str] = []
+        if self.conf.memory_prune_base:
+            base = await self.aget(where={"base": True}, include=[])
+            pruned = [id for id in base["ids"] if id not in configured]
+            for i in range(0, len(pruned), batch):
+                await self.executor.run(self.collection.delete, ids=pruned[i:i + batch])
+            self.forget_cached(pruned)
+
+        print(
+            f"[MEMORY] [{self.conf.ai_name}] Synced base memories: {len(added)} added, "
+            f"{len(rewritten) + len(relabelled)} updated, {len(pruned)} removed, "
+            f"{len(configured) - len(added) - len(rewritten) - len(relabelled)} unchanged."
+        )
+
+    async def pin_long_term(self):
+        if self.hot is None or self.conf.hot_tier_pinned <= 0:
+            return
+
+        pinned = await self.aget(
+            where={"type": "long-term"},
+            include=["embeddings", "documents", "metadatas"],
+            limit=self.conf.hot_tier_pinned
+        )
+        for id, vector, document, metadata in zip(
+                pinned["ids"], pinned["embeddings"], pinned["documents"], pinned["metadatas"]
+        ):
+            self.hot.add(id, vector, document, metadata, pinned=True)
+        print(f"[MEMORY] [{self.conf.ai_name}] Pinned {len(pinned['ids'])} long-term memories in the hot tier.")
 
     def create_memory(self, memories: list[str]):
         self.collection.upsert(
-            str(uuid4()),
+            ids=[str(uuid4()) for _ in memories],
             documents=memories,
-            metadatas={"type": "short-term"}
+            metadatas=[{"type": "short-term"} for _ in memories]
         )
 
+    async def acreate_memory(self, memories: list[str]) -> list[str]:
+        return await self.enqueue(memories, {"type": "short-term"})
+
     def create_activity_memory(self, activities: list[str]):
         self.collection.upsert(
             ids=[str(uuid4()) for _ in activities],
@@ -55,27 +195,105 @@ class Memory:
             metadatas=[{"type": "activity"} for _ in activities]
         )
 
+    async def acreate_activity_memory(self, activities: list[str]) -> list[str]:
+        return await self.enqueue(activities, {"type": "activity"})
+
+    async def refresh_count(self):
+        try:
+            self.count = await self.executor.run(self.collection.count)
+        except Exception as e:
+            print(f"[MEMORY] [{self.conf.ai_name}] [WARN] Failed to count memories: {e}")
+
+    @property
+    def backlog(self) -> int:
+        return len(self._pending) + self._in_flight
+
+    async def enqueue(self, documents: list[str], metadata: dict[str, Any]) -> list[str]:
+        ids = [str(uuid4()) for _ in documents]
+        created = time.time()
+        self._pending.extend((id, document, {**metadata, "created": created}) for id, document in zip(ids, documents))
+
+        if self.backlog >= self.conf.memory_write_max_backlog:
+            await self.flush()
+        elif len(self._pending) >= self.conf.memory_write_batch_size:
+            self._start_flush()
+        elif self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.conf.memory_write_flush_interval, self._start_flush)
+        return ids
+
+    def _start_flush(self):
+        task = asyncio.create_task(self.flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[:self.conf.memory_write_batch_size]
+                del self._pending[:len(batch)]
+                self._in_flight += len(batch)
+                try:
+                    documents = [document for _, document, _ in batch]
+                    embeddings = await self.embedding_func.aembed(documents)
+                    await self.aupsert(
+                        ids=[id for id, _, _ in batch],
+                        documents=documents,
+                        embeddings=embeddings,
+                        metadatas=[metadata for _, _, metadata in batch]
+                    )
+                    if self.hot is not None:
+                        for (id, document, metadata), vector in zip(batch, embeddings):
+                            self.hot.add(id, vector, document, metadata)
+                except BaseException as e:
+                    self._pending[:0] = batch
+                    if not isinstance(e, Exception):
+                        raise
+                    print(f"[MEMORY] [{self.conf.ai_name}] [ERROR] Failed to write {len(batch)} memories, retrying later: {e}")
+                    loop = asyncio.get_running_loop()
+                    self._flush_handle = loop.call_later(self.conf.memory_write_flush_interval, self._start_flush)
+                    return
+                finally:
+                    self._in_flight -= len(batch)
+
+    def forget_cached(self, ids: list[str]):
+        if self.hot is not None:
+            self.hot.discard(ids)
+
     def clear_activities(self):
         short_term = self.collection.get(where={"type": "activity"})
         self.collection.delete(short_term["ids"])
+        self.forget_cached(short_term["ids"])
 
     def clear_short_term(self):
         short_term = self.collection.get(where={"type": "short-term"})
         self.collection.delete(short_term["ids"])
+        self.forget_cached(short_term["ids"])
 
-    def get_memories(self, query: str = ""):
+    def get_memories(self, query: str = "", limit: int | None = None):
         data = []
         if query == "":
-            memories = self.collection.get()
-            for i in range(len(memories["ids"])):
-                data.append({
-                    "id": memories["ids"][i],
-                    "document": memories["documents"][i],
-                    "metadata": memories["metadatas"][i]
-                })
+            page_size = self.conf.memory_page_size
+            offset = 0
+            while limit is None or len(data) < limit:
+                size = page_size if limit is None else min(page_size, limit - len(data))
+                memories = self.collection.get(limit=size, offset=offset, include=["documents", "metadatas"])
+                for id, document, metadata in zip(memories["ids"], memories["documents"], memories["metadatas"]):
+                    data.append({
+                        "id": id,
+                        "document": document,
+                        "metadata": metadata
+                    })
+                if len(memories["ids"]) < size:
+                    break
+                offset += size
         else:
-            memories = self.collection.query(query_texts=query,n_results=15)
-            for i in range(len(memories["ids"])):
+            memories = self.collection.query(query_texts=query, n_results=limit or 15)
+            for i in range(len(memories["ids"][0])):
                 data.append({
                     "id": memories["ids"][0][i],
                     "document": memories["documents"][0][i],
@@ -85,3 +303,76 @@ class Memory:
 
             data = sorted(data, key=lambda x: x["distance"])
         return data
+
+    async def iter_memories(
+            self,
+            where: dict[str, Any] | None = None,
+            include_embeddings: bool = False,
+            page_size: int | None = None
+    ) -> AsyncIterator[dict[str, Any]]:
+        page_size = page_size or self.conf.memory_page_size
+        include = ["documents", "metadatas", "embeddings"] if include_embeddings else ["documents", "metadatas"]
+        offset = 0
+        while True:
+            page = await self.aget(where=where, include=include, limit=page_size, offset=offset)
+            embeddings = page["embeddings"] if include_embeddings else None
+            for i, id in enumerate(page["ids"]):
+                entry = {
+                    "id": id,
+                    "document": page["documents"][i],
+                    "metadata": page["metadatas"][i]
+                }
+                if embeddings is not None:
+                    entry["embedding"] = embeddings[i]
+                yield entry
+            if len(page["ids"]) < page_size:
+                return
+            offset += page_size
+
+    def record_recalls(self, ids: list[str]):
+        self._recalls.update(ids)
+
+    def take_recalls(self) -> Counter[str]:
+        recalls, self._recalls = self._recalls, Counter()
+        return recalls
+
+    async def recall(self, query: str, n_results: int) -> list[dict[str, Any]]:
+        [vector] = await self.embedding_func.aembed([query])
+
+        hot = self.hot.search(vector, n_results)[0] if self.hot is not None else []
+        if len(hot) == n_results and hot[-1]["distance"] <= self.conf.hot_tier_skip_distance:
+            recalls_total.inc(collection=self.conf.collection_name, tier="hot")
+            return hot
+
+        cold = await self.executor.run(
+            self.collection.query,
+            query_embeddings=[vector],
+            n_results=n_results,
+            include=["documents", "metadatas", "distances", "embeddings"]
+        )
+        recalls_total.inc(collection=self.conf.collection_name, tier="cold")
+
+        merged = {entry["id"]: entry for entry in hot}
+        for id, document, metadata, distance, embedding in zip(
+                cold["ids"][0], cold["documents"][0], cold["metadatas"][0], cold["distances"][0], cold["embeddings"][0]
+        ):
+            if id not in merged:
+                merged[id] = {"id": id, "document": document, "metadata": metadata, "distance": distance}
+            if self.hot is not None:
+                self.hot.add(id, embedding, document, metadata)
+        return sorted(merged.values(), key=lambda x: x["distance"])[:n_results]
+
+    async def aquery(self, query_texts: str | list[str], **kwargs: Any) -> chromadb.QueryResult:
+        texts = [query_texts] if isinstance(query_texts, str) else query_texts
+        embeddings = await self.embedding_func.aembed(texts)
+        return await self.executor.run(self.collection.query, query_embeddings=embeddings, **kwargs)
+
+    async def aget(self, **kwargs: Any) -> chromadb.GetResult:
+        return await self.executor.run(self.collection.get, **kwargs)
+
+    async def aupsert(self, **kwargs: Any):
+        documents = kwargs.get("documents")
+        if documents is not None and kwargs.get("embeddings") is None:
+            documents = [documents] if isinstance(documents, str) else documents
+            kwargs["embeddings"] = await self.embedding_func.aembed(documents)
+        await self.executor.run(self.collection.upsert, **kwargs)
@@ -0,0 +1,107 @@
+import argparse
+import asyncio
+import json
+from typing import Any
+
+import numpy as np
+
+from app.ai.memory import Memory, shutdown_memory_executor
+
+
+FORMAT_VERSION = 1
+
+
+def _save(path: str, arrays: dict[str, np.ndarray]):
+    with open(path, "wb") as file:
+        np.savez_compressed(file, **arrays)
+
+
+def _load(path: str) -> dict[str, np.ndarray]:
+    with np.load(path, allow_pickle=False) as archive:
+        return {name: archive[name] for name in archive.files}
+
+
+async def export_memories(memory: Memory, path: str, where: dict[str, Any] | None = None) -> int:
+    """Write a collection to a compressed .npz archive.
+
+    The archive stores ids, documents, JSON-encoded metadata and the float32
+    embedding matrix, so it can be restored without re-embedding.
+    """
+
+    ids: list[str] = []
+    documents: list[str] = []
+    metadatas: list[str] = []
+    embeddings: list[np.ndarray] = []
+    async for entry in memory.iter_memories(where=where, include_embeddings=True):
+        ids.append(entry["id"])
+        documents.append(entry["document"] or "")
+        metadatas.append(json.dumps(entry["metadata"] or {}))
+        embeddings.append(np.asarray(entry["embedding"], dtype=np.float32))
+
+    arrays = {
+        "version": np.array(FORMAT_VERSION),
+        "model": np.array(memory.conf.embedding_model),
+        "ids": np.array(ids, dtype=str),
+        "documents": np.array(documents, dtype=str),
+        "metadatas": np.array(metadatas, dtype=str),
+        "embeddings": np.stack(embeddings) if embeddings else np.zeros((0, 0), dtype=np.float32)
+    }
+    await asyncio.to_thread(_save, path, arrays)
+    print(f"[MEMORY] [{memory.conf.ai_name}] Exported {len(ids)} memories to {path}.")
+    return len(ids)
+
+
+async def import_memories(memory: Memory, path: str) -> int:
+    arrays = await asyncio.to_thread(_load, path)
+    if int(arrays["version"]) != FORMAT_VERSION:
+        raise ValueError(f"[MEMORY] Unsupported archive version {int(arrays['version'])} in {path}")
+
+    model = str(arrays["model"])
+    if model != memory.conf.embedding_model:
+        raise ValueError(
+            f"[MEMORY] Archive {path} was embedded with '{model}', "
+            f"collection uses '{memory.conf.embedding_model}'"
+        )
+
+    ids = arrays["ids"].tolist()
+    batch = memory.conf.memory_page_size
+    for i in range(0, len(ids), batch):
+        chunk = ids[i:i + batch]
+        await memory.aupsert(
+            ids=chunk,
+            documents=arrays["documents"][i:i + batch].tolist(),
+            metadatas=[json.loads(m) or None for m in arrays["metadatas"][i:i + batch].tolist()],
+            embeddings=arrays["embeddings"][i:i + batch]
+        )
+        memory.forget_cached(chunk)
+
+    print(f"[MEMORY] [{memory.conf.ai_name}] Imported {len(ids)} memories from {path}.")
+    return len(ids)
+
+
+def main():
+    from app.config import config
+
+    parser = argparse.ArgumentParser(description="Export or restore a companion's memory collection")
+    parser.add_argument("action", choices=("export", "import"))
+    parser.add_argument("companion", help="Companion key from config.yml")
+    parser.add_argument("path", help="Archive path (.npz)")
+    args = parser.parse_args()
+
+    conf = config.companions[args.companion]
+
+    async def run():
+        memory = Memory(conf, conf.memories)
+        if args.action == "export":
+            await export_memories(memory, args.path)
+        else:
+            await import_memories(memory, args.path)
+
+    try:
+        asyncio.run(run())
+    finally:
+        shutdown_memory_executor()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import asyncio
+from collections import Counter
+import time
+from typing import Any
+
+from app import telemetry
+from app.ai.memory import Memory
+
+
+maintenance_total = telemetry.counter(
+    "furina_memory_maintenance_total",
+    "Memories merged, promoted or evicted by the lifecycle job"
+)
+
+
+def retention_score(metadata: dict[str, Any], now: float, half_life: float) -> float:
+    age = max(0.0, now - float(metadata.get("last_recalled") or metadata.get("created") or now))
+    return (1 + int(metadata.get("recalls", 0))) * 0.5 ** (age / half_life)
+
+
+class MemoryLifecycle:
+    """Incremental maintenance of one memory collection.
+
+    Each step handles a single page of entries: pending recall counts are written
+    back, near-duplicates are merged into the entry worth keeping, and frequently
+    recalled short-term memories are promoted to long-term. After a full pass the
+    collection is trimmed to memory_max_entries by retention score. Base memories
+    from the config are never merged away or evicted.
+    """
+
+    def __init__(self, memory: Memory) -> None:
+        self.memory = memory
+        self.conf = memory.conf
+        self.pinned = {m.id for m in memory.memories}
+        self.offset = 0
+
+    async def run(self):
+        interval = self.conf.memory_maintenance_interval
+        if not interval:
+            return
+
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                with telemetry.span("memory.maintenance", collection=self.conf.collection_name):
+                    while await self.step():
+                        await asyncio.sleep(self.conf.memory_maintenance_pause)
+                    await self.evict()
+            except Exception as e:
+                print(f"[MEMORY] [{self.conf.ai_name}] [ERROR] Maintenance failed: {e}")
+
+    async def step(self) -> bool:
+        await self.apply_recalls()
+
+        page = await self.memory.aget(
+            include=["embeddings", "metadatas"],
+            limit=self.conf.memory_maintenance_batch,
+            offset=self.offset
+        )
+        ids = page["ids"]
+        if not ids:
+            self.offset = 0
+            return False
+
+        metadatas: dict[str, dict[str, Any]] = {id: dict(m or {}) for id, m in zip(ids, page["metadatas"] or [])}
+        removed = await self.merge_duplicates(ids, page["embeddings"], metadatas)
+        await self.promote([id for id in ids if id not in removed], metadatas)
+
+        self.offset += len(ids) - len(removed)
+        return len(ids) == self.conf.memory_maintenance_batch
+
+    async def apply_recalls(self):
+        recalls: Counter[str] = self.memory.take_recalls()
+        if not recalls:
+            return
+
+        ids = list(recalls)
+        current = await self.memory.aget(ids=ids, include=["metadatas"])
+        now = time.time()
+        updates = [
+            {"recalls": int((m or {}).get("recalls", 0)) + recalls[id], "last_recalled": now}
+            for id, m in zip(current["ids"], current["metadatas"] or [])
+        ]
+        if updates:
+            await self.memory.executor.run(self.memory.collection.update, ids=current["ids"], metadatas=updates)
+
+    def _keep_rank(self, id: str, metadata: dict[str, Any]) -> tuple[Any, ...]:
+        return (
+            id in self.pinned,
+            metadata.get("type") == "long-term",
+            int(metadata.get("recalls", 0)),
+            -float(metadata.get("created") or 0)
+        )
+
+    async def merge_duplicates(self, ids: list[str], embeddings: Any, metadatas: dict[str, dict[str, Any]]) -> set[str]:
+        if embeddings is None or len(embeddings) == 0:
+            return set()
+
+        neighbours = await self.memory.executor.run(
+            self.memory.collection.query,
+            query_embeddings=embeddings,
+            n_results=2,
+            include=["metadatas", "distances"]
+        )
+
+        removed: set[str] = set()
+        for id, found, found_meta, distances in zip(
+                ids, neighbours["ids"], neighbours["metadatas"] or [], neighbours["distances"] or []
+        ):
+            if id in removed:
+                continue
+            for other, other_meta, distance in zip(found, found_meta, distances):
+                if other == id or other in removed or distance > self.conf.memory_dedup_distance:
+                    continue
+
+                other_meta = metadatas.get(other, dict(other_meta or {}))
+                keep, drop = (id, other) if self._keep_rank(id, metadatas[id]) >= self._keep_rank(other, other_meta) else (other, id)
+                if drop in self.pinned:
+                    continue
+
+                kept_meta = metadatas[id] if keep == id else other_meta
+                dropped_meta = other_meta if keep == id else metadatas[id]
+                recalls = int(kept_meta.get("recalls", 0)) + int(dropped_meta.get("recalls", 0))
+                await self.memory.executor.run(self.memory.collection.update, ids=[keep], metadatas=[{"recalls": recalls}])
+                await self.memory.executor.run(self.memory.collection.delete, ids=[drop])
+                self.memory.forget_cached([drop])
+                kept_meta["recalls"] = recalls
+                metadatas[keep] = kept_meta
+                removed.add(drop)
+                maintenance_total.inc(collection=self.conf.collection_name, action="merged")
+
+        return removed
+
+    async def promote(self, ids: list[str], metadatas: dict[str, dict[str, Any]]):
+        promoted = [
+            id for id in ids
+            if metadatas[id].get("type") == "short-term"
+            and int(metadatas[id].get("recalls", 0)) >= self.conf.memory_promote_recalls
+        ]
+        if not promoted:
+            return
+
+        await self.memory.executor.run(
+            self.memory.collection.update,
+            ids=promoted,
+            metadatas=[{"type": "long-term"} for _ in promoted]
+        )
+        self.memory.forget_cached(promoted)
+        maintenance_total.inc(len(promoted), collection=self.conf.collection_name, action="promoted")
+
+    async def evict(self):
+        limit = self.conf.memory_max_entries
+        if limit is None:
+            return
+
+        excess = await self.memory.executor.run(self.memory.collection.count) - limit
+        if excess <= 0:
+            return
+
+        now = time.time()
+        scored: list[tuple[float, str]] = []
+        offset = 0
+        while True:
+            page = await self.memory.aget(
+                where={"type": {"$ne": "long-term"}},
+                include=["metadatas"],
+                limit=self.conf.memory_maintenance_batch,
+                offset=offset
+            )
+            if not page["ids"]:
+                break
+            scored += [
+                (retention_score(m or {}, now, self.conf.memory_decay_half_life), id)
+                for id, m in zip(page["ids"], page["metadatas"] or [])
+                if id not in self.pinned
+            ]
+            offset += len(page["ids"])
+            await asyncio.sleep(self.conf.memory_maintenance_pause)
+
+        evicted = [id for _, id in sorted(scored)[:excess]]
+        for i in range(0, len(evicted), self.conf.memory_maintenance_batch):
+            await self.memory.executor.run(
+                self.memory.collection.delete,
+                ids=evicted[i:i + self.conf.memory_maintenance_batch]
+            )
+        self.memory.forget_cached(evicted)
+        if evicted:
+            maintenance_total.inc(len(evicted), collection=self.conf.collection_name, action="evicted")
+            print(f"[MEMORY] [{self.conf.ai_name}] Evicted {len(evicted)} memories to stay under {limit}.")
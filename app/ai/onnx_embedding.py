@@ -0,0 +1,83 @@
+import os
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from chromadb.api.types import Documents, Embeddings
+from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+
+
+MAX_SEQUENCE_LENGTH = 256
+
+
+def _quantized_model(path: Path) -> Path:
+    target = path.with_name("model.int8.onnx")
+    if target.exists():
+        return target
+
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        import onnx  # noqa: F401
+    except ImportError as e:
+        raise ImportError("[EMBEDDING] The 'onnx-int8' backend requires the 'onnx' package") from e
+
+    print(f"[EMBEDDING] Quantizing {path} to int8...")
+    tmp = target.with_suffix(f".{os.getpid()}.tmp")
+    quantize_dynamic(str(path), str(tmp), weight_type=QuantType.QInt8)
+    os.replace(tmp, target)
+    return target
+
+
+class OnnxEmbeddingFunction:
+    """Mean-pooled, L2-normalized MiniLM embeddings on ONNX Runtime (CPU).
+
+    Produces the same vectors as the sentence-transformers model, so collections
+    written by the torch backend can be queried without re-embedding. Batches are
+    padded to their longest member rather than to the full sequence length.
+    """
+
+    def __init__(self, model_name: str, quantized: bool = False, threads: int | None = None) -> None:
+        if model_name != ONNXMiniLM_L6_V2.MODEL_NAME:
+            raise ValueError(
+                f"[EMBEDDING] ONNX backend only ships '{ONNXMiniLM_L6_V2.MODEL_NAME}', got '{model_name}'"
+            )
+
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        ONNXMiniLM_L6_V2(preferred_providers=["CPUExecutionProvider"])._download_model_if_not_exists()
+        folder = Path(ONNXMiniLM_L6_V2.DOWNLOAD_PATH) / ONNXMiniLM_L6_V2.EXTRACTED_FOLDER_NAME
+        path = folder / "model.onnx"
+        if quantized:
+            path = _quantized_model(path)
+
+        self.tokenizer = Tokenizer.from_file(str(folder / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQUENCE_LENGTH)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        options = onnxruntime.SessionOptions()
+        options.log_severity_level = 3
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def __call__(self, input: Documents) -> Embeddings:
+        if not input:
+            return []
+
+        encoded = self.tokenizer.encode_batch(list(input))
+        input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+
+        feeds: dict[str, Any] = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        hidden = self.session.run(None, feeds)[0]
+        mask = attention_mask[..., np.newaxis].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        norms[norms == 0] = 1e-12
+        return list((pooled / norms).astype(np.float32))
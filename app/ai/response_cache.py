@@ -0,0 +1,232 @@
+import asyncio
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import hashlib
+import json
+import sqlite3
+import time
+from typing import Any
+import numpy as np
+from overrides import final
+
+from app.models.schema import CompanionConfig
+
+
+@dataclass
+class CacheEntry:
+    context: str
+    created: float
+    response: str
+    embedding: np.ndarray | None = None
+
+
+@dataclass
+class CacheLookup:
+    key: str
+    context: str
+    embedding: np.ndarray | None
+    response: str | None
+
+
+def _normalize(msg: dict[str, Any]) -> dict[str, Any]:
+    normalized: dict[str, Any] = {"role": msg.get("role")}
+    content = msg.get("content")
+    if isinstance(content, str):
+        normalized["content"] = " ".join(content.split())
+    if msg.get("tool_calls"):
+        normalized["tool_calls"] = msg["tool_calls"]
+    if msg.get("tool_call_id"):
+        normalized["tool_call_id"] = msg["tool_call_id"]
+    return normalized
+
+
+def _digest(value: Any) -> str:
+    raw = json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+@final
+class ResponseCache:
+    """Exact and semantic cache of final responses, optionally persisted to SQLite.
+
+    Lookups are served from memory. Database writes go to a single writer thread
+    in order, so storing or evicting never blocks the event loop on a commit.
+    """
+
+    def __init__(
+            self,
+            max_entries: int = 1024,
+            ttl: float = 3600.0,
+            path: str | None = None,
+            embed: Callable[[list[str]], Any] | None = None,
+            semantic_threshold: float = 0.95
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embed = embed
+        self.semantic_threshold = semantic_threshold
+        self.entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+        self.db: sqlite3.Connection | None = None
+        self._writer: ThreadPoolExecutor | None = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="furina-cache")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, context TEXT NOT NULL, created REAL NOT NULL, "
+                "response TEXT NOT NULL, embedding BLOB)"
+            )
+            self.db.commit()
+            self._load()
+
+    @classmethod
+    def from_config(cls, conf: CompanionConfig, embed: Callable[[list[str]], Any] | None = None) -> "ResponseCache":
+        return cls(
+            max_entries=conf.cache_max_entries,
+            ttl=conf.cache_ttl,
+            path=conf.cache_path,
+            embed=embed if conf.cache_semantic else None,
+            semantic_threshold=conf.cache_semantic_threshold
+        )
+
+    def _load(self):
+        assert self.db is not None
+        self.db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+        rows = self.db.execute(
+            "SELECT key, context, created, response, embedding FROM responses ORDER BY created DESC LIMIT ?",
+            (self.max_entries,)
+        ).fetchall()
+        for key, context, created, response, embedding in reversed(rows):
+            vector = np.frombuffer(embedding, dtype=np.float32) if embedding else None
+            self.entries[key] = CacheEntry(context, created, response, vector)
+        self.db.commit()
+        print(f"[CACHE] Restored {len(rows)} cached responses.")
+
+    def _keys(self, msgs: list[dict[str, Any]], tools: Any, max_tokens: int, query: str | None, upstream: Any) -> tuple[str, str]:
+        normalized = [_normalize(m) for m in msgs]
+        prefix = normalized[:-1]
+        if query is not None and normalized and isinstance(msgs[-1].get("content"), str):
+            # The assembled user message carries conversation, knowledge and
+            # metadata around the question; all of it except the question is context.
+            head, found, tail = msgs[-1]["content"].rpartition(query)
+            rest = head + tail if found else msgs[-1]["content"]
+            prefix = prefix + [{"role": normalized[-1]["role"], "content": " ".join(rest.split())}]
+        context = _digest({"messages": prefix, "tools": tools, "max_tokens": max_tokens, "upstream": upstream})
+        key = _digest({"context": context, "last": normalized[-1] if normalized else None})
+        return key, context
+
+    def _get(self, key: str) -> CacheEntry | None:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry.created > self.ttl:
+            self._evict(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def _evict(self, key: str):
+        self.entries.pop(key, None)
+        self._write("DELETE FROM responses WHERE key = ?", (key,))
+
+    def _write(self, sql: str, params: tuple[Any, ...]):
+        if self._writer is not None:
+            self._writer.submit(self._execute, sql, params)
+
+    def _execute(self, sql: str, params: tuple[Any, ...]):
+        assert self.db is not None
+        try:
+            self.db.execute(sql, params)
+            self.db.commit()
+        except sqlite3.Error as e:
+            print(f"[CACHE] [ERROR] Failed to write the response cache: {e}")
+
+    def _embed(self, text: str) -> np.ndarray:
+        assert self.embed is not None
+        vector = np.asarray(self.embed([text])[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _semantic_match(self, context: str, vector: np.ndarray) -> str | None:
+        best_key, best_score = None, self.semantic_threshold
+        now = time.time()
+        for key, entry in self.entries.items():
+            if entry.embedding is None or entry.context != context or now - entry.created > self.ttl:
+                continue
+            score = float(np.dot(entry.embedding, vector))
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    async def lookup(
+            self,
+            msgs: list[dict[str, Any]],
+            tools: Any,
+            max_tokens: int,
+            query: str | None = None,
+            upstream: Any = None
+    ) -> CacheLookup:
+        """Find a cached response for `msgs`.
+
+        `query` is the raw user question. When given, it alone is embedded for the
+        semantic match, and the rest of the final message joins the exact context.
+        `upstream` names the endpoints and models that would answer; responses are
+        only shared between requests with the same upstream.
+        """
+        key, context = self._keys(msgs, tools, max_tokens, query, upstream)
+        entry = self._get(key)
+        if entry is not None:
+            self.hits += 1
+            return CacheLookup(key, context, entry.embedding, entry.response)
+
+        vector = None
+        text = query if query is not None else msgs[-1].get("content") if msgs else None
+        if self.embed is not None and isinstance(text, str):
+            vector = await asyncio.to_thread(self._embed, text)
+            match = self._semantic_match(context, vector)
+            if match is not None:
+                self.semantic_hits += 1
+                self.entries.move_to_end(match)
+                return CacheLookup(key, context, vector, self.entries[match].response)
+
+        self.misses += 1
+        return CacheLookup(key, context, vector, None)
+
+    def store(self, lookup: CacheLookup, response: str):
+        entry = CacheEntry(lookup.context, time.time(), response, lookup.embedding)
+        self.entries[lookup.key] = entry
+        self.entries.move_to_end(lookup.key)
+
+        embedding = entry.embedding.tobytes() if entry.embedding is not None else None
+        self._write(
+            "INSERT OR REPLACE INTO responses (key, context, created, response, embedding) VALUES (?, ?, ?, ?, ?)",
+            (lookup.key, entry.context, entry.created, response, embedding)
+        )
+
+        while len(self.entries) > self.max_entries:
+            oldest = next(iter(self.entries))
+            self._evict(oldest)
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0
+        }
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.shutdown()
+            self._writer = None
+        if self.db is not None:
+            self.db.close()
+            self.db = None
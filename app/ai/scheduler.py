@@ -0,0 +1,190 @@
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from enum import IntEnum
+import heapq
+import itertools
+import time
+from typing import Any
+from overrides import final
+
+from app.models.schema import CompanionConfig
+
+
+class Priority(IntEnum):
+    INTERACTIVE_STREAM = 0
+    INTERACTIVE = 1
+    REFLECTION = 2
+    BATCH = 3
+
+
+class SchedulerFull(Exception):
+    pass
+
+
+@final
+class TokenBucket:
+    """Rate limiter whose waiters are served in priority order.
+
+    Only the highest-priority waiter sleeps for a refill; a more urgent arrival
+    takes over the head, so background work cannot stand in front of it.
+    """
+
+    def __init__(self, rate_per_minute: float) -> None:
+        self.rate = rate_per_minute / 60
+        self.capacity = rate_per_minute
+        self.tokens = rate_per_minute
+        self.updated = time.monotonic()
+        self.condition = asyncio.Condition()
+        self._counter = itertools.count()
+        self._waiters: list[tuple[int, int]] = []
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1, priority: int = 0):
+        amount = min(amount, self.capacity)
+        async with self.condition:
+            self._refill()
+            if not self._waiters and self.tokens >= amount:
+                self.tokens -= amount
+                return
+
+            entry = (priority, next(self._counter))
+            heapq.heappush(self._waiters, entry)
+            self.condition.notify_all()
+            try:
+                while True:
+                    self._refill()
+                    head = self._waiters[0] == entry
+                    if head and self.tokens >= amount:
+                        heapq.heappop(self._waiters)
+                        self.tokens -= amount
+                        return
+                    timeout = (amount - self.tokens) / self.rate if head else None
+                    try:
+                        await asyncio.wait_for(self.condition.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                self.condition.notify_all()
+
+
+@final
+class RequestScheduler:
+    def __init__(
+            self,
+            max_concurrency: int,
+            queue_size: int,
+            requests_per_minute: float | None = None,
+            tokens_per_minute: float | None = None
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+        self._active = 0
+        self._counter = itertools.count()
+        self._waiters: list[tuple[int, int, asyncio.Future[None]]] = []
+        self._depth = {p: 0 for p in Priority}
+        self._waits = {p: [0, 0.0, 0.0] for p in Priority}
+        self._rejected = {p: 0 for p in Priority}
+
+    async def _acquire(self, priority: Priority):
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+            return
+
+        if self._depth[priority] >= self.queue_size:
+            self._rejected[priority] += 1
+            raise SchedulerFull(f"{priority.name.lower()} queue is full ({self.queue_size} waiting)")
+
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        self._depth[priority] += 1
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+        finally:
+            self._depth[priority] -= 1
+
+    def _release(self):
+        self._active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._waiters and self._active < self.max_concurrency:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self._active += 1
+            future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority, tokens: int = 0) -> AsyncIterator[None]:
+        start = time.monotonic()
+        # Rate limits are waited out before taking a concurrency slot, so a
+        # throttled low-priority request never holds a slot an interactive one needs.
+        if self.request_bucket is not None:
+            await self.request_bucket.acquire(1, priority)
+        if self.token_bucket is not None and tokens:
+            await self.token_bucket.acquire(tokens, priority)
+        await self._acquire(priority)
+        try:
+            wait = time.monotonic() - start
+            stats = self._waits[priority]
+            stats[0] += 1
+            stats[1] += wait
+            stats[2] = max(stats[2], wait)
+            yield
+        finally:
+            self._release()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "active": self._active,
+            "queued": {p.name.lower(): self._depth[p] for p in Priority},
+            "rejected": {p.name.lower(): self._rejected[p] for p in Priority},
+            "wait": {
+                p.name.lower(): {
+                    "count": count,
+                    "avg": total / count if count else 0.0,
+                    "max": max_wait
+                }
+                for p, (count, total, max_wait) in self._waits.items()
+            }
+        }
+
+
+_schedulers: dict[str, RequestScheduler] = {}
+
+
+def get_scheduler(conf: CompanionConfig, api_key: str | None = None) -> RequestScheduler:
+    api_key = api_key or conf.ai_api_key
+    scheduler = _schedulers.get(api_key)
+    if scheduler is None:
+        scheduler = RequestScheduler(
+            conf.max_concurrent_requests,
+            conf.scheduler_queue_size,
+            conf.requests_per_minute,
+            conf.tokens_per_minute
+        )
+        _schedulers[api_key] = scheduler
+    return scheduler
+
+
+def scheduler_stats() -> list[dict[str, Any]]:
+    return [
+        {"key": key[-4:], **scheduler.stats()}
+        for key, scheduler in _schedulers.items()
+    ]
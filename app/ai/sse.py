@@ -0,0 +1,40 @@
+class SSEDecoder:
+    def __init__(self) -> None:
+        self._buffer = ""
+        self._data: list[str] = []
+
+    def feed(self, chunk: str) -> list[str]:
+        text = self._buffer + chunk
+        held_cr = text.endswith("\r")
+        if held_cr:
+            text = text[:-1]
+
+        lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+        self._buffer = lines.pop() + ("\r" if held_cr else "")
+
+        events: list[str] = []
+        for line in lines:
+            self._process_line(line, events)
+        return events
+
+    def flush(self) -> list[str]:
+        events: list[str] = []
+        if self._buffer:
+            self._process_line(self._buffer.rstrip("\r"), events)
+            self._buffer = ""
+        self._process_line("", events)
+        return events
+
+    def _process_line(self, line: str, events: list[str]):
+        if not line:
+            if self._data:
+                events.append("\n".join(self._data))
+                self._data = []
+            return
+
+        if line.startswith(":"):
+            return
+
+        field, _, value = line.partition(":")
+        if field == "data":
+            self._data.append(value[1:] if value.startswith(" ") else value)
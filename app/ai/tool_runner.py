@@ -0,0 +1,96 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import inspect
+import json
+from typing import Any
+
+from app import telemetry
+from app.models.schema import CompanionConfig
+
+
+tool_calls_total = telemetry.counter("furina_tool_calls_total", "Tool invocations by tool and outcome")
+
+_executors: dict[tuple[str, int], Executor] = {}
+
+
+def get_tool_executor(kind: str, workers: int) -> Executor:
+    key = (kind, workers)
+    executor = _executors.get(key)
+    if executor is None:
+        if kind == "process":
+            executor = ProcessPoolExecutor(max_workers=workers)
+        elif kind == "thread":
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="furina-tool")
+        else:
+            raise ValueError(f"[TOOLS] Unknown tool executor '{kind}', expected 'thread' or 'process'")
+        _executors[key] = executor
+    return executor
+
+
+def shutdown_tool_executors():
+    executors = list(_executors.values())
+    _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ToolRunner:
+    def __init__(self, conf: CompanionConfig, tool_registry: Any) -> None:
+        self.conf = conf
+        self.registry = tool_registry
+        self.executor = get_tool_executor(conf.tool_executor, conf.tool_workers)
+
+    def _log(self, name: str, args: dict[str, Any]):
+        log = f"[AI CLIENT] Running [{name}] with ("
+        for k, v in args.items():
+            log += f"\n    {k}={v}"
+        if args:
+            log += "\n"
+        log += ")"
+        print(log)
+
+    async def run(self, name: str, args: dict[str, Any]) -> str:
+        tool = self.registry.get(name)
+        if not tool:
+            return f"[AI CLIENT] [Error] Tool '{name}' not found"
+
+        if not (hasattr(tool, "run") and callable(tool.run)):
+            return "[AI CLIENT] [Error] Invalid tool"
+
+        self._log(name, args)
+        timeout = getattr(tool, "timeout", self.conf.tool_timeout)
+
+        with telemetry.span("tool", tool=name):
+            try:
+                if inspect.iscoroutinefunction(tool.run):
+                    result = await asyncio.wait_for(tool.run(args), timeout)
+                else:
+                    loop = asyncio.get_running_loop()
+                    result = await asyncio.wait_for(loop.run_in_executor(self.executor, tool.run, args), timeout)
+                tool_calls_total.inc(tool=name, status="ok")
+                return result
+            except asyncio.TimeoutError:
+                tool_calls_total.inc(tool=name, status="timeout")
+                print(f"[AI CLIENT] [ERROR] Tool '{name}' timed out after {timeout}s")
+                return f"[AI CLIENT] [Error] Tool '{name}' timed out after {timeout}s"
+            except Exception as e:
+                tool_calls_total.inc(tool=name, status="error")
+                print(f"[AI CLIENT] [ERROR] Tool '{name}' failed: {e}")
+                return f"[AI CLIENT] [Error] Tool '{name}' failed: {e}"
+
+    async def run_calls(self, tool_calls: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        async def run_call(call: dict[str, Any]) -> dict[str, Any]:
+            name = call["function"]["name"]
+            try:
+                arguments = json.loads(call["function"].get("arguments") or "{}")
+                output = await self.run(name, arguments)
+            except json.JSONDecodeError as e:
+                output = f"[AI CLIENT] [Error] Invalid arguments for '{name}': {e}"
+
+            return {
+                "role": "tool",
+                "tool_call_id": call["id"],
+                "content": output
+            }
+
+        return list(await asyncio.gather(*(run_call(call) for call in tool_calls)))
@@ -0,0 +1,95 @@
+import asyncio
+from typing import Any
+import zlib
+
+from app import telemetry
+from app.cluster.worker import open_request, owner, read_replies, worker_socket
+from app.companion.session import session_key
+from app.models.codec import HandlerError, InvalidMessage, decode_prompt_message
+from app.models.schema import CompanionConfig, PromptMessage, WorkersConfig
+
+
+routed_total = telemetry.counter("furina_router_requests_total", "Prompt messages forwarded to worker processes")
+
+
+class Router:
+    """Front-end handlers that forward prompt messages to worker processes.
+
+    In "shard" mode each companion lives on exactly one worker, picked by its
+    name. In "replicate" mode every worker serves every companion, and a
+    conversation (companion, user, source) always lands on the same worker so
+    its session stays in one process; conversations are keyed like the
+    companion's own sessions, so a message without a user lands with the
+    companion's `user_name`. The returned context has the same shape
+    as get_context(), so entrypoints run unchanged in front of the workers.
+    """
+
+    def __init__(self, conf: WorkersConfig, processes: int, companions: dict[str, CompanionConfig]) -> None:
+        self.conf = conf
+        self.processes = processes
+        self.companions = {c.ai_name.strip().lower(): c for c in companions.values()}
+
+    def route(self, msg: PromptMessage) -> int:
+        if self.conf.mode == "shard":
+            return owner(msg.companion_name, self.processes)
+        name = msg.companion_name.strip().lower()
+        companion = self.companions.get(name)
+        conversation = session_key(companion, msg) if companion is not None else f"{msg.user or ''}/{msg.source}"
+        return zlib.crc32(f"{name}/{conversation}".encode()) % self.processes
+
+    def _target(self, message: str | bytes) -> tuple[int, bytes]:
+        data = message.encode() if isinstance(message, str) else message
+        return self.route(decode_prompt_message(data)), data
+
+    async def handle(self, message: str | bytes) -> str:
+        try:
+            worker, data = self._target(message)
+        except InvalidMessage as e:
+            return f"[CONTEXT] [ERROR] Invalid message: {e}"
+        routed_total.inc(worker=worker, mode="complete")
+
+        try:
+            reader, writer = await open_request(worker_socket(self.conf.socket_dir, worker), "handle", data)
+        except OSError as e:
+            return f"[ROUTER] [ERROR] Worker {worker} unavailable: {e}"
+        try:
+            async for reply in read_replies(reader):
+                if "error" in reply:
+                    return f"[ROUTER] [ERROR] Worker {worker}: {reply['error']}"
+                return reply["result"]
+            return f"[ROUTER] [ERROR] Worker {worker} closed the connection"
+        finally:
+            writer.close()
+
+    async def handle_stream(self, message: str | bytes):
+        try:
+            worker, data = self._target(message)
+        except InvalidMessage as e:
+            raise HandlerError(400, f"Invalid message: {e}") from e
+        routed_total.inc(worker=worker, mode="stream")
+
+        try:
+            reader, writer = await open_request(worker_socket(self.conf.socket_dir, worker), "stream", data)
+        except OSError as e:
+            raise HandlerError(503, f"Worker {worker} unavailable: {e}") from e
+        try:
+            async for reply in read_replies(reader):
+                if "error" in reply:
+                    raise HandlerError(reply.get("status", 502), f"Worker {worker}: {reply['error']}")
+                yield reply["chunk"]
+        finally:
+            writer.close()
+
+    async def handle_many(self, messages: list[str | bytes]) -> list[str]:
+        results = await asyncio.gather(*(self.handle(m) for m in messages), return_exceptions=True)
+        return [
+            f"[CONTEXT] [ERROR] {type(r).__name__}: {r}" if isinstance(r, BaseException) else r
+            for r in results
+        ]
+
+    def context(self) -> dict[str, Any]:
+        return {
+            "handle_stream": self.handle_stream,
+            "handle": self.handle,
+            "handle_many": self.handle_many
+        }
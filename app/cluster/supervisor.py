@@ -0,0 +1,146 @@
+import asyncio
+from dataclasses import dataclass
+import json
+import os
+import sys
+import time
+
+from app.ai.embedding import CHROMA_SERVERS_ENV
+from app.cluster.worker import open_request, read_replies, worker_socket
+from app.models.schema import Config
+
+
+CHROMA_COMMAND = "import sys; from chromadb.cli.cli import app; sys.argv[0] = 'chroma'; app()"
+
+
+@dataclass
+class Child:
+    name: str
+    args: list[str]
+    process: asyncio.subprocess.Process | None = None
+    started: float = 0
+    ready: bool = False
+    failures: int = 0
+    restarts: int = 0
+
+
+class Supervisor:
+    """Starts and watches the worker processes and the shared Chroma servers.
+
+    Each distinct `chroma_path` gets one `chroma run` server, the only process
+    that writes the store; workers connect to it over HTTP. Workers are pinged
+    every `health_interval` seconds. A worker is restarted when it exits, when it
+    has not answered a ping within `startup_grace` of being started, or when it
+    misses `max_failures` pings in a row after that. Children run in their own
+    session so terminal signals reach only the supervisor, which stops them.
+    """
+
+    def __init__(self, config: Config, processes: int, main_path: str) -> None:
+        self.config = config
+        self.conf = config.workers
+        self.processes = processes
+
+        paths = sorted({c.chroma_path for c in config.companions.values()})
+        self.chroma_servers = {path: f"{self.conf.chroma_host}:{self.conf.chroma_port + i}" for i, path in enumerate(paths)}
+        self.chroma = [
+            Child(f"chroma:{path}", [sys.executable, "-c", CHROMA_COMMAND, "run", "--path", path, "--host", server.rsplit(":", 1)[0], "--port", server.rsplit(":", 1)[1]])
+            for path, server in self.chroma_servers.items()
+        ]
+        self.workers = [
+            Child(f"worker-{i}", [sys.executable, main_path, "--workers", str(processes), "--worker", str(i)])
+            for i in range(processes)
+        ]
+
+    async def _spawn(self, child: Child):
+        env = {**os.environ, CHROMA_SERVERS_ENV: json.dumps(self.chroma_servers)}
+        child.process = await asyncio.create_subprocess_exec(*child.args, env=env, start_new_session=True)
+        child.started = time.monotonic()
+        child.ready = False
+        child.failures = 0
+        print(f"[SUPERVISOR] Started {child.name} (pid {child.process.pid})")
+
+    async def _wait_for_chroma(self, server: str, timeout: float = 60):
+        host, port = server.rsplit(":", 1)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                _, writer = await asyncio.open_connection(host, int(port))
+                writer.close()
+                return
+            except OSError:
+                await asyncio.sleep(0.2)
+        raise TimeoutError(f"[SUPERVISOR] [ERROR] Chroma server {server} did not start within {timeout}s")
+
+    async def start(self):
+        os.makedirs(self.conf.socket_dir, exist_ok=True)
+        for child in self.chroma:
+            await self._spawn(child)
+        await asyncio.gather(*(self._wait_for_chroma(server) for server in self.chroma_servers.values()))
+        for child in self.workers:
+            await self._spawn(child)
+
+    async def _stop(self, child: Child, timeout: float = 10):
+        process = child.process
+        if process is None or process.returncode is not None:
+            return
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+
+    async def _restart(self, child: Child, reason: str):
+        print(f"[SUPERVISOR] [ERROR] Restarting {child.name}: {reason}")
+        await self._stop(child)
+        child.restarts += 1
+        await asyncio.sleep(self.conf.restart_delay)
+        await self._spawn(child)
+
+    async def ping(self, index: int) -> dict[str, object]:
+        reader, writer = await open_request(worker_socket(self.conf.socket_dir, index), "ping")
+        try:
+            async for reply in read_replies(reader):
+                return reply["pong"]
+            raise ConnectionError("No reply to ping")
+        finally:
+            writer.close()
+
+    async def _check(self, index: int, child: Child):
+        if child.process is None or child.process.returncode is not None:
+            code = child.process.returncode if child.process else None
+            await self._restart(child, f"exited with code {code}")
+            return
+
+        try:
+            await asyncio.wait_for(self.ping(index), self.conf.health_timeout)
+        except (OSError, asyncio.TimeoutError, ValueError, KeyError) as e:
+            if not child.ready:
+                if time.monotonic() - child.started > self.conf.startup_grace:
+                    await self._restart(child, f"not ready after {self.conf.startup_grace}s")
+                return
+            child.failures += 1
+            print(f"[SUPERVISOR] [WARN] {child.name} failed health check {child.failures}/{self.conf.max_failures}: {e!r}")
+            if child.failures >= self.conf.max_failures:
+                await self._restart(child, "unresponsive")
+            return
+
+        if not child.ready:
+            print(f"[SUPERVISOR] {child.name} ready after {time.monotonic() - child.started:.2f}s")
+        child.ready = True
+        child.failures = 0
+
+    async def monitor(self):
+        try:
+            while True:
+                await asyncio.sleep(self.conf.health_interval)
+                for child in self.chroma:
+                    if child.process is not None and child.process.returncode is not None:
+                        await self._restart(child, f"exited with code {child.process.returncode}")
+                await asyncio.gather(*(self._check(i, child) for i, child in enumerate(self.workers)))
+        except asyncio.CancelledError:
+            pass
+
+    async def stop(self):
+        await asyncio.gather(*(self._stop(child, 30) for child in self.workers))
+        await asyncio.gather(*(self._stop(child) for child in self.chroma))
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import os
+from typing import Any
+import zlib
+
+from app.models.codec import HandlerError
+
+
+# One request per Unix socket connection: a header line `<op> <length>\n`
+# followed by `length` bytes of PromptMessage JSON. The worker answers with
+# JSON lines ({"chunk"}, {"result"}, {"error"} with an optional "status",
+# {"pong"}) and a final {"done": true}. Closing the connection cancels the request.
+OPS = ("handle", "stream", "ping")
+
+
+def worker_socket(socket_dir: str, index: int) -> str:
+    return os.path.join(socket_dir, f"worker-{index}.sock")
+
+
+def owner(name: str, workers: int) -> int:
+    return zlib.crc32(name.strip().lower().encode()) % workers
+
+
+async def open_request(path: str, op: str, data: bytes = b"") -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    reader, writer = await asyncio.open_unix_connection(path)
+    writer.write(f"{op} {len(data)}\n".encode() + data)
+    await writer.drain()
+    return reader, writer
+
+
+async def read_replies(reader: asyncio.StreamReader):
+    while line := await reader.readline():
+        reply = json.loads(line)
+        if reply.get("done"):
+            return
+        yield reply
+
+
+class WorkerServer:
+    def __init__(self, ctx: dict[str, Any], index: int) -> None:
+        self.handle = ctx["handle"]
+        self.handle_stream = ctx["handle_stream"]
+        self.index = index
+        self.active = 0
+
+    async def _send(self, writer: asyncio.StreamWriter, reply: dict[str, Any]):
+        writer.write(json.dumps(reply).encode() + b"\n")
+        await writer.drain()
+
+    async def _run(self, op: str, data: bytes, writer: asyncio.StreamWriter):
+        try:
+            if op == "ping":
+                await self._send(writer, {"pong": {"worker": self.index, "pid": os.getpid(), "active": self.active}})
+            elif op == "handle":
+                await self._send(writer, {"result": await self.handle(data)})
+            else:
+                async for chunk in self.handle_stream(data):
+                    await self._send(writer, {"chunk": chunk})
+        except ConnectionError:
+            return
+        except HandlerError as e:
+            await self._send(writer, {"error": str(e), "status": e.status})
+        except Exception as e:
+            print(f"[WORKER] [{self.index}] [ERROR] {op} failed: {e}")
+            await self._send(writer, {"error": f"{type(e).__name__}: {e}"})
+        await self._send(writer, {"done": True})
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.active += 1
+        try:
+            op, _, length = (await reader.readline()).decode().strip().partition(" ")
+            if op not in OPS or not length.isdigit():
+                await self._send(writer, {"error": f"Bad request header '{op} {length}'"})
+                return
+            data = await reader.readexactly(int(length))
+
+            task = asyncio.create_task(self._run(op, data, writer))
+            hangup = asyncio.create_task(reader.read(1))
+            await asyncio.wait((task, hangup), return_when=asyncio.FIRST_COMPLETED)
+            if not task.done():
+                task.cancel()
+            hangup.cancel()
+            await asyncio.gather(task, hangup, return_exceptions=True)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.active -= 1
+            writer.close()
+
+
+async def start_worker_server(ctx: dict[str, Any], index: int, socket_dir: str) -> asyncio.Task[None]:
+    os.makedirs(socket_dir, exist_ok=True)
+    path = worker_socket(socket_dir, index)
+    if os.path.exists(path):
+        os.unlink(path)
+
+    server = await asyncio.start_unix_server(WorkerServer(ctx, index).serve, path)
+    print(f"[WORKER] [{index}] Listening on unix:{path}")
+
+    async def run():
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if os.path.exists(path):
+                os.unlink(path)
+
+    return asyncio.create_task(run())
@@ -1,10 +1,20 @@
-from copy import deepcopy
+from typing import TYPE_CHECKING
+import httpx
 from overrides import final
 
 from app.ai.ai_client import AIClient
+from app.ai.failover import UpstreamError
 from app.ai.memory import Memory
+from app.ai.scheduler import Priority, SchedulerFull
+from app import telemetry
+from app.companion.history import ConversationHistory
+from app.companion.session import Session, SessionStore, message_user, session_key
+from app.companion.token_budget import PromptBudget, estimate_tokens, fit_items, truncate_to_tokens
 from app.models.schema import CompanionConfig, Message, PromptMessage
 
+if TYPE_CHECKING:
+    from app.companion.reflection import ReflectionPool
+
 
 @final
 class Companion:
@@ -12,16 +22,20 @@ class Companion:
         self.config = config
         self.ai_client = client
         self.memory = memory
-        self.message_history: list[Message] = []
-        self._processed_count = 0
+        self.sessions = SessionStore(config)
+        self.reflector: "ReflectionPool | None" = None
 
     def _get_user(self, msg: PromptMessage):
-        return msg.user if msg.user else self.config.user_name
+        return message_user(self.config, msg)
+
+    def session_key(self, msg: PromptMessage) -> str:
+        return session_key(self.config, msg)
 
-    def _build_messages(self, msg: PromptMessage) -> list[Message]:
+    async def _build_messages(self, msg: PromptMessage, history: ConversationHistory) -> list[Message]:
         messages: list[Message] = []
+        budget = PromptBudget.for_request(self.config, msg.max_tokens)
 
-        system_prompt = msg.system_prompt.strip()
+        system_prompt = truncate_to_tokens(msg.system_prompt.strip(), budget.system)
         if system_prompt:
             if msg.use_personality:
                 messages.append(Message("system", self.config.personality_prompt + "\n" + system_prompt))
@@ -36,94 +50,123 @@ class Companion:
             metadata += "\n".join(f"- {k}: {v}" for k, v in msg.metadata.items())
             metadata += "\nEnd of metadata section\n"
 
-        user_prompt = self.get_knowledge_for(msg.user_prompt) if msg.allow_memory_lookup else ""
+        user_line = self._get_user(msg) + ": " + truncate_to_tokens(msg.user_prompt, budget.user)
+        remaining = budget.total - sum(estimate_tokens(m.content) for m in messages)
+        remaining -= estimate_tokens(metadata) + estimate_tokens(user_line)
+
+        conversation = ""
+        knowledge = ""
+        if msg.allow_memory_lookup:
+            conversation = self._conversation_section(history, min(budget.conversation, remaining))
+            remaining -= estimate_tokens(conversation)
+            knowledge = await self.get_knowledge_for(msg.user_prompt, min(budget.knowledge, remaining))
 
         user_message = Message(
             role="user",
-            content=metadata + user_prompt + self._get_user(msg) + ": " + msg.user_prompt,
+            content=conversation + knowledge + metadata + user_line,
         )
 
         messages.append(user_message)
         return messages
 
     async def ask_stream(self, msg: PromptMessage):
-        messages = self._build_messages(msg)
-
-        full_response = ""
-        async for chunk in self.ai_client.post_messages_stream(messages, msg.max_tokens):
-            full_response += chunk
-            yield chunk
-
-        if msg.allow_memory_insertion:
-            self.message_history.append(Message("user", self._get_user(msg) + ": " + msg.user_prompt))
-            self.message_history.append(Message("assistant", full_response))
+        session = await self.sessions.get(self.session_key(msg))
+        async with session.lock:
+            with telemetry.span("build_messages", companion=self.config.ai_name):
+                messages = await self._build_messages(msg, session.history)
+
+            parts: list[str] = []
+            async for chunk in self.ai_client.post_messages_stream(
+                messages, msg.max_tokens, msg.use_cache, query=msg.user_prompt
+            ):
+                parts.append(chunk)
+                yield chunk
+
+            if msg.allow_memory_insertion:
+                self.sessions.append(session, "user", self._get_user(msg) + ": " + msg.user_prompt)
+                self.sessions.append(session, "assistant", "".join(parts))
+                self._history_changed(session)
 
     async def ask(self, msg: PromptMessage) -> str:
         msg.user = self._get_user(msg)
-        messages = self._build_messages(msg)
+        session = await self.sessions.get(self.session_key(msg))
+        async with session.lock:
+            with telemetry.span("build_messages", companion=self.config.ai_name):
+                messages = await self._build_messages(msg, session.history)
 
-        response = await self.ai_client.post_messages(messages, msg.max_tokens)
+            response = await self.ai_client.post_messages(messages, msg.max_tokens, msg.use_cache, query=msg.user_prompt)
 
-        if msg.allow_memory_insertion:
-            self.message_history.append(Message("user", self._get_user(msg) + ": " + msg.user_prompt))
-            self.message_history.append(Message("assistant", response))
+            if msg.allow_memory_insertion:
+                self.sessions.append(session, "user", self._get_user(msg) + ": " + msg.user_prompt)
+                self.sessions.append(session, "assistant", response)
+                self._history_changed(session)
 
         return response
 
-    async def reflect(self, max_tokens: int = 200):
-        if self._processed_count > len(self.message_history):
-            self._processed_count = 0
-
-        if len(self.message_history) - self._processed_count >= 10:
-            print(f"[COMPANION] [{self.config.ai_name}] Reflecting...")
-            msgs = deepcopy(self.message_history[-(len(self.message_history) - self._processed_count):])
-
-            for msg in msgs:
-                if msg.role == "user" and msg.content != "":
-                    msg.content = msg.content + "\n"
-                elif msg.role == "assistant" and msg.content != "":
-                    msg.content = self.config.ai_name + ":" + msg.content + "\n"
-
-            chat_section = ""
-            for msg in msgs:
-                chat_section += msg.content
-
-            raw_memories = await self.ai_client.post_messages(
-                [Message("user", chat_section + self.config.memory_prompt)],
-                max_tokens
-            )
-            new_memories = raw_memories.split("{qa}")
-
-            for memory in new_memories:
-                memory = memory.strip()
-                if memory != "":
-                    self.memory.create_memory([memory])
-
-            self._processed_count = len(self.message_history)
-            print(f"[COMPANION] [{self.config.ai_name}] has {len(new_memories)} new memories.")
-
-    def get_knowledge_for(self, prompt: str) -> str:
-        memories = self.memory.collection.query(
-                query_texts=prompt,
-                n_results=self.config.memory_recall_count
-        )
-        text = ""
-        if len(memories["ids"][0]):
-            text += f"{self.config.ai_name} knows these things:\n"
-            for i in range(len(memories["ids"][0])):
-                text += memories["documents"][0][i] + "\n"
-            text += "End of knowledge section\n"
-
-        not_processed_count = len(self.message_history) - self._processed_count
-        not_processed = self.message_history[-not_processed_count:]
-
-        if not_processed:
-            text += "Latest conversation messages:\n"
-            for msg in not_processed:
-                if msg.role == "user" and msg.content != "":
-                    text += msg.content + "\n"
-                elif msg.role == "assistant" and msg.content != "":
-                    text += self.config.ai_name + ":" + msg.content + "\n"
-            text += "End of conversation section.\n"
-
-        return text
+    async def recover(self):
+        for session in await self.sessions.recover():
+            self._history_changed(session)
+
+    def _history_changed(self, session: Session):
+        if self.reflector is not None:
+            self.reflector.notify(self, session)
+
+    async def reflect_session(self, session: Session, max_tokens: int = 200):
+        if session.reflecting:
+            return
+        session.reflecting = True
+        try:
+            with telemetry.span("reflect", companion=self.config.ai_name):
+                print(f"[COMPANION] [{self.config.ai_name}] Reflecting on {session.key}...")
+                reflected = session.history.appended
+                chat_section = session.history.pending_text()
+
+                try:
+                    raw_memories = await self.ai_client.post_messages(
+                        [Message("user", chat_section + self.config.memory_prompt)],
+                        max_tokens,
+                        use_cache=False,
+                        priority=Priority.REFLECTION
+                    )
+                except (SchedulerFull, UpstreamError, httpx.HTTPError) as e:
+                    print(f"[COMPANION] [{self.config.ai_name}] [WARN] Reflection postponed: {e}")
+                    return
+                new_memories = [m.strip() for m in raw_memories.split("{qa}") if m.strip() != ""]
+                await self.memory.acreate_memory(new_memories)
+
+                await self.memory.flush()
+                self.sessions.mark_reflected(session, reflected)
+                await self.sessions.persist(session)
+                print(f"[COMPANION] [{self.config.ai_name}] has {len(new_memories)} new memories from {session.key}.")
+        finally:
+            session.reflecting = False
+
+    async def get_knowledge_for(self, prompt: str, budget: int) -> str:
+        header = f"{self.config.ai_name} knows these things:\n"
+        footer = "End of knowledge section\n"
+        budget -= estimate_tokens(header) + estimate_tokens(footer)
+        if budget <= 0:
+            return ""
+
+        with telemetry.span("memory.query", collection=self.config.collection_name):
+            memories = await self.memory.recall(prompt, self.config.memory_recall_count)
+        self.memory.record_recalls([m["id"] for m in memories])
+        documents = list(dict.fromkeys(m["document"] + "\n" for m in memories))
+        selected, _ = fit_items(documents, budget)
+        if not selected:
+            return ""
+
+        return header + "".join(selected) + footer
+
+    def _conversation_section(self, history: ConversationHistory, budget: int) -> str:
+        header = "Latest conversation messages:\n"
+        footer = "End of conversation section.\n"
+        budget -= estimate_tokens(header) + estimate_tokens(footer)
+        if budget <= 0:
+            return ""
+
+        conversation = history.render(budget)
+        if not conversation:
+            return ""
+
+        return header + conversation + footer
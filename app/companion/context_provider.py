@@ -1,14 +1,20 @@
-import json
+import asyncio
 
 from app.ai.ai_client import AIClient
 from app.ai.memory import Memory
+from app.ai.response_cache import ResponseCache
+from app import telemetry
+from app.ai.scheduler import SchedulerFull, scheduler_stats
 from app.companion.companion import Companion
 from app.config import config
 from app.loaders.tool_loader import load_tools
-from app.models.schema import PromptMessage
+from app.models.codec import HandlerError, InvalidMessage, decode_prompt_message
 
 
 _companions: dict[str, Companion] | None = None
+_by_name: dict[str, Companion] = {}
+
+requests_total = telemetry.counter("furina_requests_total", "Prompt messages received by the context handlers")
 
 def get_context():
     registry, desc_list = load_tools()
@@ -17,34 +23,91 @@ def get_context():
     if _companions is None:
         companions: dict[str, Companion] = {}
         for name, conf in config.companions.items():
-            ai_client = AIClient(conf.ai_api_url, conf.ai_api_key, registry, desc_list)
             memory = Memory(conf, conf.memories)
+            cache = ResponseCache.from_config(conf, memory.embedding_func) if conf.cache_enabled else None
+            ai_client = AIClient(conf, registry, desc_list, cache)
             companion = Companion(conf, ai_client, memory)
             companions[name] = companion
         _companions = companions
+        _by_name.update((c.config.ai_name.strip().lower(), c) for c in companions.values())
+
+        telemetry.gauge(
+            "furina_memories",
+            "Documents stored per memory collection",
+            lambda: {
+                telemetry.labels(collection=c.config.collection_name): c.memory.count
+                for c in _companions.values()
+            }
+        )
+        telemetry.gauge(
+            "furina_memory_write_backlog",
+            "Memories waiting to be written per collection",
+            lambda: {
+                telemetry.labels(collection=c.config.collection_name): c.memory.backlog
+                for c in _companions.values()
+            }
+        )
+        telemetry.gauge(
+            "furina_scheduler_queued",
+            "Requests waiting for an upstream slot per API key and priority",
+            lambda: {
+                telemetry.labels(key=stats["key"], priority=priority): depth
+                for stats in scheduler_stats()
+                for priority, depth in stats["queued"].items()
+            }
+        )
+        telemetry.gauge(
+            "furina_embedding_cache_hit_ratio",
+            "Query-embedding cache hit ratio per embedding model",
+            lambda: {
+                telemetry.labels(model=c.memory.embedding_func.model_name): c.memory.embedding_func.stats()["hit_rate"]
+                for c in _companions.values()
+            }
+        )
 
-    async def handle_stream(message: str):
-        msg = PromptMessage(**json.loads(message))
-        name = msg.companion_name.strip().lower()
+    async def handle_stream(message: str | bytes):
+        try:
+            with telemetry.span("decode"):
+                msg = decode_prompt_message(message)
+        except InvalidMessage as e:
+            raise HandlerError(400, f"Invalid message: {e}") from e
+        requests_total.inc(companion=msg.companion_name, mode="stream")
 
-        companion = next((c for c in _companions.values() if c.config.ai_name.lower() == name), None)
+        companion = _by_name.get(msg.companion_name.strip().lower())
         if companion is None:
-            print(f"[CONTEXT] [ERROR] Companion '{msg.companion_name}' not found.")
-            return
-        async for chunk in companion.ask_stream(msg):
-            yield chunk
+            raise HandlerError(404, f"Companion '{msg.companion_name}' not found.")
+        try:
+            async for chunk in companion.ask_stream(msg):
+                yield chunk
+        except SchedulerFull as e:
+            raise HandlerError(503, f"Companion '{msg.companion_name}' is busy: {e}") from e
 
-    async def handle(message: str) -> str:
-        msg = PromptMessage(**json.loads(message))
-        name = msg.companion_name.strip().lower()
+    async def handle(message: str | bytes) -> str:
+        try:
+            with telemetry.span("decode"):
+                msg = decode_prompt_message(message)
+        except InvalidMessage as e:
+            return f"[CONTEXT] [ERROR] Invalid message: {e}"
+        requests_total.inc(companion=msg.companion_name, mode="complete")
 
-        companion = next((c for c in _companions.values() if c.config.ai_name.lower() == name), None)
+        companion = _by_name.get(msg.companion_name.strip().lower())
         if companion is None:
             return f"[CONTEXT] [ERROR] Companion '{msg.companion_name}' not found."
 
-        return await companion.ask(msg)
+        try:
+            return await companion.ask(msg)
+        except SchedulerFull as e:
+            return f"[CONTEXT] [ERROR] Companion '{msg.companion_name}' is busy: {e}"
+
+    async def handle_many(messages: list[str | bytes]) -> list[str]:
+        results = await asyncio.gather(*(handle(m) for m in messages), return_exceptions=True)
+        return [
+            f"[CONTEXT] [ERROR] {type(r).__name__}: {r}" if isinstance(r, BaseException) else r
+            for r in results
+        ]
 
     return _companions, {
         "handle_stream": handle_stream,
-        "handle": handle
+        "handle": handle,
+        "handle_many": handle_many
     }
@@ -0,0 +1,138 @@
+import asyncio
+import json
+import mmap
+import os
+from pathlib import Path
+from typing import Any
+
+
+class ConversationLog:
+    """Append-only, segmented JSON-lines log of conversation turns.
+
+    Records are appended to the newest segment and rotated at `segment_bytes`.
+    A checkpoint names the log position up to which every record is already part
+    of the persisted session files, so recovery only replays the tail after it,
+    read through mmap, and segments before the checkpoint can be deleted. Each
+    process start opens a fresh segment, so a torn last line is never appended to.
+
+    `append` only buffers; `write` hands everything buffered so far to a thread.
+    Batches are taken and written in call order, and each write returns the log
+    position just after its batch.
+    """
+
+    def __init__(self, directory: Path, segment_bytes: int) -> None:
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment = 0
+        self._file: Any = None
+        self._unsynced = False
+        self._buffer: list[bytes] = []
+        self._lock = asyncio.Lock()
+
+    def _path(self, segment: int) -> Path:
+        return self.directory / f"{segment:08d}.log"
+
+    def _segments(self) -> list[int]:
+        if not self.directory.exists():
+            return []
+        return sorted(int(p.stem) for p in self.directory.glob("*.log") if p.stem.isdigit())
+
+    def open(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        segments = self._segments()
+        self.segment = (segments[-1] if segments else 0) + 1
+        self._file = open(self._path(self.segment), "ab")
+
+    @property
+    def opened(self) -> bool:
+        return self._file is not None or bool(self._buffer)
+
+    @property
+    def buffered(self) -> int:
+        return len(self._buffer)
+
+    def append(self, record: dict[str, Any]):
+        self._buffer.append(json.dumps(record, separators=(",", ":")).encode() + b"\n")
+
+    def _write(self, data: bytes) -> tuple[int, int]:
+        if self._file is None:
+            self.open()
+        if data:
+            self._file.write(data)
+            self._file.flush()
+            self._unsynced = True
+            if self._file.tell() >= self.segment_bytes:
+                self._file.close()
+                self.segment += 1
+                self._file = open(self._path(self.segment), "ab")
+        return self.segment, self._file.tell()
+
+    async def write(self) -> tuple[int, int]:
+        # Taking the batch before waiting on the lock keeps batches in call order.
+        data, self._buffer = b"".join(self._buffer), []
+        async with self._lock:
+            return await asyncio.to_thread(self._write, data)
+
+    async def sync(self):
+        async with self._lock:
+            if self._unsynced and self._file is not None:
+                self._unsynced = False
+                await asyncio.to_thread(os.fsync, self._file.fileno())
+
+    def close(self):
+        self._write(b"".join(self._buffer))
+        self._buffer = []
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+
+    def read_checkpoint(self) -> tuple[int, int]:
+        try:
+            with open(self.directory / "checkpoint.json") as file:
+                data = json.load(file)
+            return data["segment"], data["offset"]
+        except FileNotFoundError:
+            return 0, 0
+
+    def write_checkpoint(self, position: tuple[int, int]):
+        path = self.directory / "checkpoint.json"
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w") as file:
+            json.dump({"segment": position[0], "offset": position[1]}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, path)
+
+    def _read_segment(self, segment: int, start: int) -> list[dict[str, Any]]:
+        records: list[dict[str, Any]] = []
+        with open(self._path(segment), "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            if size <= start:
+                return records
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                position = start
+                while position < size:
+                    end = data.find(b"\n", position)
+                    if end == -1:
+                        break
+                    try:
+                        records.append(json.loads(data[position:end]))
+                    except ValueError:
+                        print(f"[LOG] [WARN] Skipping corrupt record in {self._path(segment)} at {position}")
+                    position = end + 1
+        return records
+
+    def replay(self) -> list[dict[str, Any]]:
+        segment, offset = self.read_checkpoint()
+        records: list[dict[str, Any]] = []
+        for current in self._segments():
+            if current < segment or current == self.segment:
+                continue
+            records += self._read_segment(current, offset if current == segment else 0)
+        return records
+
+    def compact(self, position: tuple[int, int]):
+        for segment in self._segments():
+            if segment < position[0]:
+                self._path(segment).unlink(missing_ok=True)
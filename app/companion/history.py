@@ -0,0 +1,137 @@
+from bisect import bisect_left
+from collections import deque
+from typing import Any
+
+from app.companion.token_budget import estimate_tokens
+
+
+class ConversationHistory:
+    """Bounded conversation log kept as pre-rendered prompt lines.
+
+    Turns are numbered by a sequence that only grows. Token and character counts
+    are stored cumulatively, so picking the newest unreflected turns that fit a
+    budget is a bisect plus one slice of the cached text, however long the history.
+    At most `capacity` turns are kept; unreflected turns that fall off the end are
+    folded into a rolling summary capped at `summary_tokens` until reflected.
+    """
+
+    def __init__(self, ai_name: str, capacity: int, summary_tokens: int) -> None:
+        self.ai_name = ai_name
+        self.capacity = capacity
+        self.summary_tokens = summary_tokens
+
+        self.appended = 0
+        self.reflected = 0
+        self._first = 0
+        self._offset = 0
+        self._lines: list[str] = []
+        self._tokens: list[int] = [0]
+        self._chars: list[int] = [0]
+        self._text = ""
+
+        self._summary: deque[tuple[int, str, int]] = deque()
+        self._summary_used = 0
+
+    def __len__(self) -> int:
+        return self.appended - self._first
+
+    @property
+    def pending(self) -> int:
+        return self.appended - self.reflected
+
+    @property
+    def summary(self) -> str:
+        return "".join(line for _, line, _ in self._summary)
+
+    def _index(self, seq: int) -> int:
+        return self._offset + seq - self._first
+
+    def _start(self) -> int:
+        return self._index(max(self.reflected, self._first))
+
+    def _render(self, role: str, content: str) -> str:
+        if content == "":
+            return ""
+        if role == "assistant":
+            return self.ai_name + ":" + content + "\n"
+        return content + "\n"
+
+    def append(self, role: str, content: str):
+        self._push(self._render(role, content))
+
+    def _push(self, line: str):
+        self._lines.append(line)
+        self._tokens.append(self._tokens[-1] + estimate_tokens(line))
+        self._chars.append(self._chars[-1] + len(line))
+        self._text += line
+        self.appended += 1
+
+        while len(self) > self.capacity:
+            self._evict()
+
+    def _evict(self):
+        i = self._offset
+        line = self._lines[i]
+        if self._first >= self.reflected:
+            self._text = self._text[len(line):]
+            tokens = self._tokens[i + 1] - self._tokens[i]
+            self._summary.append((self._first, line, tokens))
+            self._summary_used += tokens
+            while self._summary_used > self.summary_tokens:
+                self._summary_used -= self._summary.popleft()[2]
+
+        self._first += 1
+        self._offset += 1
+        if self._offset >= self.capacity:
+            del self._lines[:self._offset]
+            del self._tokens[:self._offset]
+            del self._chars[:self._offset]
+            self._offset = 0
+
+    def pending_text(self) -> str:
+        return self.summary + self._text
+
+    def mark_reflected(self, seq: int):
+        if seq <= self.reflected:
+            return
+
+        self.reflected = min(seq, self.appended)
+        while self._summary and self._summary[0][0] < self.reflected:
+            self._summary_used -= self._summary.popleft()[2]
+        self._text = "".join(self._lines[self._start():])
+
+    def render(self, budget: int) -> str:
+        if budget <= 0:
+            return ""
+
+        start = self._start()
+        if self._tokens[-1] - self._tokens[start] <= budget:
+            if self._summary and self._tokens[-1] - self._tokens[start] + self._summary_used <= budget:
+                return self.summary + self._text
+            return self._text
+
+        first = bisect_left(self._tokens, self._tokens[-1] - budget, lo=start)
+        return self._text[self._chars[first] - self._chars[start]:]
+
+    def to_state(self) -> dict[str, Any]:
+        return {
+            "first": self._first,
+            "reflected": self.reflected,
+            "lines": self._lines[self._offset:],
+            "summary": [list(entry) for entry in self._summary]
+        }
+
+    @classmethod
+    def from_state(cls, ai_name: str, capacity: int, summary_tokens: int, state: dict[str, Any]) -> "ConversationHistory":
+        history = cls(ai_name, capacity, summary_tokens)
+        # The saved summary holds older turns than any line, so it goes in first
+        # and turns evicted by a smaller capacity are folded in after it.
+        for seq, line, tokens in state["summary"]:
+            history._summary.append((seq, line, tokens))
+            history._summary_used += tokens
+        history.appended = history._first = state["first"]
+        history.reflected = state["reflected"]
+        for line in state["lines"]:
+            history._push(line)
+        history._text = "".join(history._lines[history._start():])
+        return history
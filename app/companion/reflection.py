@@ -0,0 +1,83 @@
+import asyncio
+from typing import TYPE_CHECKING
+
+from app.companion.session import Session
+
+if TYPE_CHECKING:
+    from app.companion.companion import Companion
+
+
+class ReflectionPool:
+    """Shared workers that reflect sessions when their history grows.
+
+    Appends notify the pool. Once a session has at least `reflection_min_batch`
+    unreflected turns, it is queued after `reflection_debounce` seconds without
+    further appends, so a burst of turns becomes a single reflection. A session
+    that never goes quiet is still queued `reflection_max_delay` seconds after it
+    first became due, before its turns can age out of the history. A session is
+    held in the queue until its reflection returns, so it never runs on two
+    workers at once; turns that arrive meanwhile are picked up afterwards. At
+    most `workers` reflections run at once, across all companions.
+    """
+
+    def __init__(self, workers: int) -> None:
+        self.workers = workers
+        self.queue: asyncio.Queue[tuple["Companion", Session]] = asyncio.Queue()
+        self._timers: dict[tuple[str, str], asyncio.TimerHandle] = {}
+        self._deadlines: dict[tuple[str, str], float] = {}
+        self._queued: set[tuple[str, str]] = set()
+        self._tasks: list[asyncio.Task[None]] = []
+
+    def register(self, companion: "Companion"):
+        companion.reflector = self
+
+    def notify(self, companion: "Companion", session: Session):
+        if session.history.pending < companion.config.reflection_min_batch:
+            return
+
+        key = (companion.config.collection_name, session.key)
+        session.scheduled = True
+        if key in self._queued:
+            return
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        loop = asyncio.get_running_loop()
+        deadline = self._deadlines.setdefault(key, loop.time() + companion.config.reflection_max_delay)
+        self._timers[key] = loop.call_at(
+            min(loop.time() + companion.config.reflection_debounce, deadline),
+            self._enqueue, key, companion, session
+        )
+
+    def _enqueue(self, key: tuple[str, str], companion: "Companion", session: Session):
+        self._timers.pop(key, None)
+        self._deadlines.pop(key, None)
+        if key not in self._queued:
+            self._queued.add(key)
+            self.queue.put_nowait((companion, session))
+
+    async def _work(self):
+        while True:
+            companion, session = await self.queue.get()
+            key = (companion.config.collection_name, session.key)
+            try:
+                await companion.reflect_session(session)
+            except Exception as e:
+                print(f"[REFLECTION] [ERROR] Reflecting {session.key} for {companion.config.ai_name} failed: {e}")
+            finally:
+                self._queued.discard(key)
+                self.queue.task_done()
+            self.notify(companion, session)
+            session.scheduled = key in self._timers or key in self._queued
+
+    def start(self) -> list[asyncio.Task[None]]:
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        return self._tasks
+
+    def stop(self):
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        self._deadlines.clear()
+        for task in self._tasks:
+            task.cancel()
@@ -0,0 +1,225 @@
+import asyncio
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+import hashlib
+import json
+import os
+from pathlib import Path
+import time
+from typing import Any
+import zlib
+
+from app.companion.conversation_log import ConversationLog
+from app.companion.history import ConversationHistory
+from app.models.schema import CompanionConfig, PromptMessage
+
+
+def message_user(conf: CompanionConfig, msg: PromptMessage) -> str:
+    return msg.user if msg.user else conf.user_name
+
+
+def session_key(conf: CompanionConfig, msg: PromptMessage) -> str:
+    return f"{message_user(conf, msg)}/{msg.source}"
+
+
+@dataclass
+class Session:
+    key: str
+    history: ConversationHistory
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    last_active: float = field(default_factory=time.monotonic)
+    reflecting: bool = False
+    scheduled: bool = False
+
+
+class SessionStore:
+    """Conversation sessions of one companion, keyed by user and source.
+
+    Sessions are spread over `session_shards` dicts so idle sweeps and lookups only
+    touch one shard at a time. Each session serializes its own turns through its
+    lock. Sessions idle for `session_idle_timeout` seconds are written to
+    `session_dir` and dropped from memory; the next request for the key restores them.
+    Every turn and reflection cursor is also appended to a ConversationLog, so turns
+    since the last checkpoint survive a crash.
+    """
+
+    def __init__(self, conf: CompanionConfig) -> None:
+        self.conf = conf
+        self.shards: list[dict[str, Session]] = [{} for _ in range(max(1, conf.session_shards))]
+        self.directory = Path(conf.session_dir) / conf.collection_name
+        self._next_sweep = 0
+
+        self.log = ConversationLog(self.directory / "log", conf.log_segment_bytes) if conf.session_log else None
+        self._dirty: set[str] = set()
+        self._writer: asyncio.Task[None] | None = None
+        self._since_checkpoint = 0
+        self._last_checkpoint = time.monotonic()
+
+    def __iter__(self) -> Iterator[Session]:
+        for shard in self.shards:
+            yield from list(shard.values())
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self.shards)
+
+    def _shard(self, key: str) -> dict[str, Session]:
+        return self.shards[zlib.crc32(key.encode()) % len(self.shards)]
+
+    def _path(self, key: str) -> Path:
+        return self.directory / (hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+    def _new_history(self, state: dict[str, Any] | None = None) -> ConversationHistory:
+        args = (self.conf.ai_name, self.conf.history_max_messages, self.conf.history_summary_tokens)
+        if state is None:
+            return ConversationHistory(*args)
+        return ConversationHistory.from_state(*args, state)
+
+    def _load(self, key: str) -> dict[str, Any] | None:
+        try:
+            with open(self._path(key)) as file:
+                return json.load(file)["history"]
+        except FileNotFoundError:
+            return None
+
+    def _save(self, key: str, state: dict[str, Any]):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w") as file:
+            json.dump({"key": key, "history": state}, file)
+        os.replace(tmp, path)
+
+    async def get(self, key: str) -> Session:
+        shard = self._shard(key)
+        session = shard.get(key)
+        if session is None:
+            session = shard[key] = Session(key, self._new_history())
+            async with session.lock:
+                try:
+                    state = await asyncio.to_thread(self._load, key)
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"[SESSION] [{self.conf.ai_name}] [ERROR] Failed to restore session '{key}': {e}")
+                    state = None
+                if state is not None:
+                    session.history = self._new_history(state)
+
+        session.last_active = time.monotonic()
+        return session
+
+    def append(self, session: Session, role: str, content: str):
+        seq = session.history.appended
+        session.history.append(role, content)
+        self._logged(session, {"k": session.key, "n": seq, "r": role, "c": content})
+
+    def mark_reflected(self, session: Session, seq: int):
+        session.history.mark_reflected(seq)
+        self._logged(session, {"k": session.key, "x": seq})
+
+    def _logged(self, session: Session, record: dict[str, Any]):
+        if self.log is None:
+            return
+        self.log.append(record)
+        self._dirty.add(session.key)
+        self._since_checkpoint += 1
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._drain_log())
+
+    async def _drain_log(self):
+        assert self.log is not None
+        try:
+            while self.log.buffered:
+                await self.log.write()
+        except OSError as e:
+            print(f"[SESSION] [{self.conf.ai_name}] [ERROR] Failed to write conversation log: {e}")
+
+    async def recover(self) -> list[Session]:
+        if self.log is None:
+            return []
+
+        records = await asyncio.to_thread(self.log.replay)
+        self.log.open()
+
+        touched: dict[str, Session] = {}
+        for record in records:
+            session = touched.get(record["k"])
+            if session is None:
+                session = touched[record["k"]] = await self.get(record["k"])
+            history = session.history
+            if "x" in record:
+                history.mark_reflected(record["x"])
+            elif record["n"] == history.appended:
+                history.append(record["r"], record["c"])
+            elif record["n"] > history.appended:
+                print(f"[SESSION] [{self.conf.ai_name}] [WARN] Gap in log for '{record['k']}' at turn {history.appended}")
+                history.append(record["r"], record["c"])
+
+        if records:
+            self._dirty.update(touched)
+            await self.checkpoint()
+            print(f"[SESSION] [{self.conf.ai_name}] Recovered {len(records)} log records for {len(touched)} sessions.")
+        return list(touched.values())
+
+    async def checkpoint(self):
+        if self.log is None or not self.log.opened:
+            return
+
+        dirty, self._dirty = self._dirty, set()
+        self._since_checkpoint = 0
+        self._last_checkpoint = time.monotonic()
+
+        position = await self.log.write()
+        await self.log.sync()
+        for key in dirty:
+            session = self._shard(key).get(key)
+            if session is not None:
+                await self.persist(session)
+        await asyncio.to_thread(self.log.write_checkpoint, position)
+        await asyncio.to_thread(self.log.compact, position)
+
+    async def maybe_checkpoint(self):
+        if self.log is None or not self.log.opened:
+            return
+        await self.log.sync()
+        elapsed = time.monotonic() - self._last_checkpoint
+        if self._since_checkpoint >= self.conf.log_checkpoint_records or (self._dirty and elapsed >= self.conf.log_checkpoint_interval):
+            await self.checkpoint()
+
+    async def close(self):
+        await self.save_all()
+        if self.log is not None and self.log.opened:
+            await self.checkpoint()
+            self.log.close()
+
+    async def evict_idle(self):
+        shard = self.shards[self._next_sweep]
+        self._next_sweep = (self._next_sweep + 1) % len(self.shards)
+
+        deadline = time.monotonic() - self.conf.session_idle_timeout
+        for key, session in list(shard.items()):
+            if not self._idle(session, deadline):
+                continue
+            # Save while the session is still reachable, so a concurrent get()
+            # keeps using it instead of loading a stale file; drop it only if
+            # nothing touched it meanwhile.
+            seen = (session.history.appended, session.history.reflected)
+            try:
+                await asyncio.to_thread(self._save, key, session.history.to_state())
+            except OSError as e:
+                print(f"[SESSION] [{self.conf.ai_name}] [ERROR] Failed to persist session '{key}': {e}")
+                continue
+            unchanged = seen == (session.history.appended, session.history.reflected)
+            if shard.get(key) is session and unchanged and self._idle(session, deadline):
+                del shard[key]
+
+    def _idle(self, session: Session, deadline: float) -> bool:
+        return not (session.last_active > deadline or session.lock.locked() or session.reflecting or session.scheduled)
+
+    async def persist(self, session: Session):
+        try:
+            await asyncio.to_thread(self._save, session.key, session.history.to_state())
+        except OSError as e:
+            print(f"[SESSION] [{self.conf.ai_name}] [ERROR] Failed to persist session '{session.key}': {e}")
+
+    async def save_all(self):
+        for session in self:
+            await self.persist(session)
@@ -0,0 +1,64 @@
+from dataclasses import dataclass
+import re
+
+from app.models.schema import CompanionConfig
+
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    tokens = 0
+    for match in _TOKEN_PATTERN.finditer(text):
+        length = match.end() - match.start()
+        tokens += 1 if length <= 4 else (length + 3) // 4
+    return tokens
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    if budget <= 0:
+        return ""
+    if estimate_tokens(text) <= budget:
+        return text
+
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low]
+
+
+def fit_items(items: list[str], budget: int, contiguous: bool = False) -> tuple[list[str], int]:
+    selected: list[str] = []
+    used = 0
+    for item in items:
+        cost = estimate_tokens(item)
+        if used + cost > budget:
+            if contiguous:
+                break
+            continue
+        selected.append(item)
+        used += cost
+    return selected, used
+
+
+@dataclass
+class PromptBudget:
+    total: int
+    system: int
+    knowledge: int
+    conversation: int
+    user: int
+
+    @classmethod
+    def for_request(cls, conf: CompanionConfig, max_tokens: int) -> "PromptBudget":
+        return cls(
+            total=max(conf.context_window - max_tokens, 0),
+            system=conf.prompt_budget_system,
+            knowledge=conf.prompt_budget_knowledge,
+            conversation=conf.prompt_budget_conversation,
+            user=conf.prompt_budget_user
+        )
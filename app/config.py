@@ -1,6 +1,6 @@
 import os
 import yaml
-from app.models.schema import CompanionConfig, Config, MemoryEntry
+from app.models.schema import CompanionConfig, Config, EndpointConfig, GatewayConfig, MemoryEntry, MetricsConfig, ReflectionConfig, WorkersConfig
 
 
 def load_config(path: str) -> Config:
@@ -8,15 +8,21 @@ def load_config(path: str) -> Config:
         raw = yaml.safe_load(file)["config"]
 
     timezone = raw.get("timezone", "UTC")
+    metrics = MetricsConfig(**(raw.get("metrics") or {}))
+    reflection = ReflectionConfig(**(raw.get("reflection") or {}))
+    gateway = GatewayConfig(**(raw.get("gateway") or {}))
+    workers = WorkersConfig(**(raw.get("workers") or {}))
     companions = {}
     for name, data in raw["companions"].items():
         memory_data = data.pop("memories", [])
         memory_objects = [MemoryEntry(**mem) for mem in memory_data]
-        companions[name] = CompanionConfig(memories=memory_objects, **data)
+        endpoint_data = data.pop("ai_endpoints", [])
+        endpoint_objects = [EndpointConfig(**endpoint) for endpoint in endpoint_data]
+        companions[name] = CompanionConfig(memories=memory_objects, ai_endpoints=endpoint_objects, **data)
 
     print(f"[CONFIG] Loaded {len(companions)} companions")
 
-    return Config(companions=companions, timezone=timezone)
+    return Config(companions=companions, timezone=timezone, metrics=metrics, reflection=reflection, gateway=gateway, workers=workers)
 
 
 default_file = os.path.expanduser("~/.config/furina/config.yml")
@@ -0,0 +1,107 @@
+from collections.abc import Callable
+from dataclasses import MISSING, fields
+import json
+from types import NoneType, UnionType
+from typing import Any, Union, get_args, get_origin, get_type_hints
+
+from app.models.schema import PromptMessage
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class InvalidMessage(ValueError):
+    pass
+
+
+class HandlerError(Exception):
+    """A request the context handlers refused, with the HTTP status that fits it."""
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+def _checker(tp: Any) -> Callable[[Any], bool]:
+    if tp is bool:
+        return lambda v: isinstance(v, bool)
+    if tp is int:
+        return lambda v: isinstance(v, int) and not isinstance(v, bool)
+    if tp is NoneType:
+        return lambda v: v is None
+    if tp in (str, float):
+        return lambda v: isinstance(v, tp)
+
+    origin = get_origin(tp)
+    if origin is dict:
+        check_key, check_value = map(_checker, get_args(tp))
+        return lambda v: isinstance(v, dict) and all(check_key(k) and check_value(x) for k, x in v.items())
+    if origin in (Union, UnionType):
+        checks = [_checker(arg) for arg in get_args(tp)]
+        return lambda v: any(check(v) for check in checks)
+    return lambda v: True
+
+
+def _type_name(tp: Any) -> str:
+    if get_origin(tp) is None and hasattr(tp, "__name__"):
+        return tp.__name__
+    return str(tp).replace("typing.", "")
+
+
+class _FieldValidator:
+    """Validate decoded JSON against a dataclass without msgspec.
+
+    The per-field type checks are built once, so decoding a message is a dict
+    lookup and a precompiled check per field.
+    """
+
+    def __init__(self, cls: type) -> None:
+        self.cls = cls
+        hints = get_type_hints(cls)
+        self.fields = [
+            (f.name, _checker(hints[f.name]), _type_name(hints[f.name]), f.default is MISSING and f.default_factory is MISSING)
+            for f in fields(cls)
+        ]
+
+    def __call__(self, data: Any) -> Any:
+        if not isinstance(data, dict):
+            raise InvalidMessage(f"Expected a JSON object, got {type(data).__name__}")
+
+        values: dict[str, Any] = {}
+        for name, check, type_name, required in self.fields:
+            if name not in data:
+                if required:
+                    raise InvalidMessage(f"Object missing required field `{name}`")
+                continue
+            value = data[name]
+            if not check(value):
+                raise InvalidMessage(f"Expected `{type_name}`, got `{type(value).__name__}` - at `$.{name}`")
+            values[name] = value
+        return self.cls(**values)
+
+
+if msgspec is not None:
+    _decoder = msgspec.json.Decoder(PromptMessage)
+
+    def decode_prompt_message(data: str | bytes) -> PromptMessage:
+        try:
+            return _decoder.decode(data)
+        except msgspec.DecodeError as e:
+            raise InvalidMessage(str(e)) from e
+else:
+    _loads: Callable[[str | bytes], Any] = orjson.loads if orjson is not None else json.loads
+    _validate = _FieldValidator(PromptMessage)
+
+    def decode_prompt_message(data: str | bytes) -> PromptMessage:
+        try:
+            payload = _loads(data)
+        except ValueError as e:
+            raise InvalidMessage(f"Malformed JSON: {e}") from e
+        return _validate(payload)
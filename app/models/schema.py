@@ -15,6 +15,7 @@ class PromptMessage:
     max_tokens: int
     stream: bool
     user: str | None = None
+    use_cache: bool = True
 
 @dataclass
 class Message:
@@ -27,6 +28,12 @@ class MemoryEntry:
     document: str
     metadata: dict[str, str]
 
+@dataclass
+class EndpointConfig:
+    url: str
+    api_key: str
+    model: str = "deepseek-chat"
+
 @dataclass
 class CompanionConfig:
     user_name: str
@@ -39,8 +46,117 @@ class CompanionConfig:
     ai_api_url: str
     personality_prompt: str
     memories: list[MemoryEntry] = field(default_factory=list)
+    ai_model: str = "deepseek-chat"
+    ai_endpoints: list[EndpointConfig] = field(default_factory=list)
+    http2: bool = False
+    http_max_connections: int = 20
+    http_max_keepalive_connections: int = 10
+    http_keepalive_expiry: float = 60.0
+    http_connect_timeout: float = 10.0
+    http_timeout: float = 120.0
+    http_stream_timeout: float | None = None
+    tool_executor: Literal["thread", "process"] = "thread"
+    tool_workers: int = 4
+    tool_timeout: float = 60.0
+    max_tool_rounds: int = 8
+    cache_enabled: bool = False
+    cache_max_entries: int = 1024
+    cache_ttl: float = 3600.0
+    cache_path: str | None = None
+    cache_semantic: bool = False
+    cache_semantic_threshold: float = 0.95
+    max_concurrent_requests: int = 8
+    scheduler_queue_size: int = 64
+    requests_per_minute: float | None = None
+    tokens_per_minute: float | None = None
+    max_retries: int = 2
+    retry_base_delay: float = 0.5
+    retry_max_delay: float = 8.0
+    breaker_failure_threshold: int = 5
+    breaker_reset_timeout: float = 30.0
+    hedge_requests: bool = False
+    hedge_delay: float = 2.0
+    context_window: int = 64000
+    prompt_budget_system: int = 2000
+    prompt_budget_knowledge: int = 1500
+    prompt_budget_conversation: int = 3000
+    prompt_budget_user: int = 4000
+    history_max_messages: int = 200
+    history_summary_tokens: int = 500
+    session_dir: str = "./sessions"
+    session_shards: int = 16
+    session_idle_timeout: float = 900
+    session_log: bool = True
+    log_segment_bytes: int = 4 * 1024 * 1024
+    log_checkpoint_records: int = 1000
+    log_checkpoint_interval: float = 60
+    reflection_min_batch: int = 10
+    reflection_debounce: float = 10
+    reflection_max_delay: float = 60
+    chroma_path: str = "./chroma"
+    embedding_model: str = "all-MiniLM-L6-v2"
+    embedding_backend: str = "torch"
+    embedding_cache_size: int = 4096
+    embedding_batch_window: float = 0.005
+    embedding_max_batch: int = 64
+    memory_workers: int = 2
+    memory_queue_size: int = 32
+    memory_write_batch_size: int = 32
+    memory_page_size: int = 256
+    memory_prune_base: bool = False
+    memory_write_flush_interval: float = 1.0
+    memory_write_max_backlog: int = 1024
+    memory_maintenance_interval: float | None = 300
+    memory_maintenance_batch: int = 64
+    memory_maintenance_pause: float = 0.05
+    memory_dedup_distance: float = 0.05
+    memory_promote_recalls: int = 3
+    memory_max_entries: int | None = 5000
+    memory_decay_half_life: float = 604800
+    hot_tier_size: int = 1024
+    hot_tier_pinned: int = 256
+    hot_tier_skip_distance: float = 0.3
+
+@dataclass
+class MetricsConfig:
+    enabled: bool = False
+    host: str = "127.0.0.1"
+    port: int | None = 9464
+    log_spans: bool = False
+    refresh_interval: float = 30
+
+@dataclass
+class ReflectionConfig:
+    workers: int = 2
+
+@dataclass
+class GatewayConfig:
+    enabled: bool = True
+    host: str = "127.0.0.1"
+    port: int | None = 8765
+    unix_socket: str | None = None
+    max_connections: int = 1024
+    max_streams_per_connection: int = 32
+    max_body_bytes: int = 1024 * 1024
+
+@dataclass
+class WorkersConfig:
+    processes: int = 1
+    mode: Literal["replicate", "shard"] = "replicate"
+    socket_dir: str = "./run"
+    chroma_host: str = "127.0.0.1"
+    chroma_port: int = 8300
+    health_interval: float = 5
+    health_timeout: float = 5
+    max_failures: int = 3
+    startup_grace: float = 120
+    restart_delay: float = 1
 
 @dataclass
 class Config:
     timezone: str
     companions: dict[str, CompanionConfig]
+    metrics: MetricsConfig = field(default_factory=MetricsConfig)
+    reflection: ReflectionConfig = field(default_factory=ReflectionConfig)
+    gateway: GatewayConfig = field(default_factory=GatewayConfig)
+    workers: WorkersConfig = field(default_factory=WorkersConfig)
@@ -0,0 +1,261 @@
+import asyncio
+from bisect import bisect_left
+from collections.abc import Callable
+import contextvars
+from dataclasses import dataclass, field
+import itertools
+import time
+from typing import Any, Protocol
+
+
+_enabled = False
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def configure(enable: bool):
+    global _enabled
+    _enabled = enable
+
+
+def _labels_key(labels: dict[str, Any]) -> tuple[tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: tuple[tuple[str, str], ...], extra: tuple[tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self.values: dict[tuple[tuple[str, str], ...], float] = {}
+
+    def inc(self, value: float = 1, **labels: Any):
+        if not _enabled:
+            return
+        key = _labels_key(labels)
+        self.values[key] = self.values.get(key, 0) + value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(k)} {v}" for k, v in self.values.items()]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.values: dict[tuple[tuple[str, str], ...], list[float]] = {}
+
+    def observe(self, value: float, **labels: Any):
+        if not _enabled:
+            return
+        key = _labels_key(labels)
+        series = self.values.get(key)
+        if series is None:
+            series = self.values[key] = [0.0] * (len(self.buckets) + 3)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in self.values.items():
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, (('le', '+Inf'),))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help: str, collect: Callable[[], dict[tuple[tuple[str, str], ...], float]]) -> None:
+        self.name = name
+        self.help = help
+        self.collect = collect
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.collect()
+        except Exception as e:
+            print(f"[METRICS] [ERROR] Collecting {self.name}: {e}")
+            return lines
+        lines += [f"{self.name}{_format_labels(k)} {v}" for k, v in values.items()]
+        return lines
+
+
+_metrics: dict[str, Counter | Histogram | Gauge] = {}
+
+
+def counter(name: str, help: str) -> Counter:
+    metric = _metrics.get(name)
+    if metric is None:
+        metric = _metrics[name] = Counter(name, help)
+    assert isinstance(metric, Counter)
+    return metric
+
+
+def histogram(name: str, help: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    metric = _metrics.get(name)
+    if metric is None:
+        metric = _metrics[name] = Histogram(name, help, buckets)
+    assert isinstance(metric, Histogram)
+    return metric
+
+
+def gauge(name: str, help: str, collect: Callable[[], dict[tuple[tuple[str, str], ...], float]]) -> Gauge:
+    metric = _metrics[name] = Gauge(name, help, collect)
+    return metric
+
+
+def labels(**values: Any) -> tuple[tuple[str, str], ...]:
+    return _labels_key(values)
+
+
+def render_prometheus() -> str:
+    lines: list[str] = []
+    for metric in _metrics.values():
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+@dataclass
+class SpanRecord:
+    name: str
+    trace_id: int
+    span_id: int
+    parent_id: int | None
+    start: float
+    duration: float = 0.0
+    attributes: dict[str, Any] = field(default_factory=dict)
+    error: str | None = None
+
+
+class SpanExporter(Protocol):
+    def export(self, span: SpanRecord) -> None: ...
+
+
+class LogExporter:
+    def export(self, span: SpanRecord):
+        attributes = " ".join(f"{k}={v}" for k, v in span.attributes.items())
+        status = f" error={span.error}" if span.error else ""
+        print(f"[TRACE] {span.trace_id:x}/{span.span_id:x} {span.name} {span.duration * 1000:.2f}ms {attributes}{status}")
+
+
+_exporters: list[SpanExporter] = []
+_ids = itertools.count(1)
+_current: contextvars.ContextVar[SpanRecord | None] = contextvars.ContextVar("furina_span", default=None)
+
+span_seconds = histogram("furina_span_seconds", "Duration of traced hot-path sections")
+
+
+def add_exporter(exporter: SpanExporter):
+    _exporters.append(exporter)
+
+
+class Span:
+    def __init__(self, name: str, attributes: dict[str, Any]) -> None:
+        self.name = name
+        self.attributes = attributes
+        self.record: SpanRecord | None = None
+        self.token: contextvars.Token[SpanRecord | None] | None = None
+
+    def set(self, key: str, value: Any):
+        if self.record is not None:
+            self.record.attributes[key] = value
+
+    def __enter__(self) -> "Span":
+        parent = _current.get()
+        span_id = next(_ids)
+        self.record = SpanRecord(
+            self.name,
+            parent.trace_id if parent is not None else span_id,
+            span_id,
+            parent.span_id if parent is not None else None,
+            time.perf_counter(),
+            attributes=self.attributes
+        )
+        self.token = _current.set(self.record)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        assert self.record is not None and self.token is not None
+        record = self.record
+        record.duration = time.perf_counter() - record.start
+        if exc is not None:
+            record.error = type(exc).__name__
+        try:
+            _current.reset(self.token)
+        except ValueError:
+            pass
+        span_seconds.observe(record.duration, span=record.name)
+        for exporter in _exporters:
+            exporter.export(record)
+        return False
+
+
+class _NoopSpan:
+    def set(self, key: str, value: Any):
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, **attributes: Any) -> Span | _NoopSpan:
+    if not _enabled:
+        return _NOOP_SPAN
+    return Span(name, attributes)
+
+
+async def start_metrics_server(host: str, port: int) -> asyncio.Server:
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                body = render_prometheus().encode()
+                status = "200 OK"
+            else:
+                body = b"not found\n"
+                status = "404 Not Found"
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    port = server.sockets[0].getsockname()[1]
+    print(f"[METRICS] Serving Prometheus metrics on http://{host}:{port}/metrics")
+    return server
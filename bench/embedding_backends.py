@@ -0,0 +1,127 @@
+import argparse
+import json
+import platform
+import time
+from typing import Any
+
+import numpy as np
+
+from bench.run_benchmark import git_revision, percentiles
+
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+BATCH_SIZES = (1, 8, 64)
+
+
+def load_corpus(path: str | None) -> list[str]:
+    if path is not None:
+        with open(path) as file:
+            return [line.strip() for line in file if line.strip()]
+
+    from app.config import config
+    corpus = [m.document for conf in config.companions.values() for m in conf.memories]
+    subjects = ["Furina", "Neuvillette", "the Opera Epiclese", "Fontaine", "the Hydro Archon", "the audience"]
+    actions = ["watched a trial at", "argued about", "wrote a play about", "had tea with", "was afraid of", "sang for"]
+    objects = ["the prophecy", "the Oratrice", "a macaron", "the Primordial Sea", "a crowded theatre", "the rain"]
+    corpus += [f"{s} {a} {o}." for s in subjects for a in actions for o in objects]
+    return corpus
+
+
+def top_k(vectors: np.ndarray, k: int) -> np.ndarray:
+    scores = vectors @ vectors.T
+    np.fill_diagonal(scores, -np.inf)
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def recall_at_k(reference: np.ndarray, candidate: np.ndarray) -> float:
+    hits = sum(len(set(r) & set(c)) for r, c in zip(reference, candidate))
+    return hits / reference.size
+
+
+def bench_backend(name: str, model: str, corpus: list[str], rounds: int, k: int) -> dict[str, Any]:
+    from app.ai.embedding import EmbeddingService
+
+    start = time.perf_counter()
+    function = EmbeddingService(model, backend=name).load()
+    load_time = time.perf_counter() - start
+
+    vectors = np.asarray(function(corpus), dtype=np.float32)
+    result: dict[str, Any] = {"load_time": load_time, "batches": {}}
+
+    for size in BATCH_SIZES:
+        batches = [[corpus[(i * size + j) % len(corpus)] for j in range(size)] for i in range(rounds)]
+        function(batches[0])
+        samples: list[float] = []
+        for batch in batches:
+            t = time.perf_counter()
+            function(batch)
+            samples.append(time.perf_counter() - t)
+        result["batches"][size] = {
+            "latency": percentiles(samples),
+            "texts_per_second": size * len(samples) / sum(samples)
+        }
+
+    result["neighbours"] = top_k(vectors, k)
+    result["vectors"] = vectors
+    return result
+
+
+def print_summary(results: dict[str, Any]):
+    for name, result in results["backends"].items():
+        recall = result.get("recall_at_k")
+        recall_text = f", recall@{results['settings']['k']}={recall:.3f}" if recall is not None else ""
+        print(f"[BENCH] {name}: loaded in {result['load_time']:.2f}s{recall_text}")
+        for size, stats in result["batches"].items():
+            latency = stats["latency"]
+            print(
+                f"[BENCH]   batch={size}: p50={latency['p50'] * 1000:.1f}ms p95={latency['p95'] * 1000:.1f}ms "
+                f"{stats['texts_per_second']:.0f} texts/s"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare embedding backends: recall@k against a reference and latency per batch size")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--reference", choices=BACKENDS, default="torch",
+                        help="Backend whose nearest neighbours count as ground truth")
+    parser.add_argument("--corpus", default=None, help="Text file with one document per line (default: config memories plus a synthetic set)")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--output", default="bench_embeddings.json")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    k = min(args.k, len(corpus) - 1)
+    names = list(dict.fromkeys([args.reference, *args.backends]))
+    backends = {name: bench_backend(name, args.model, corpus, args.rounds, k) for name in names}
+
+    reference = backends[args.reference]
+    for result in backends.values():
+        result["recall_at_k"] = recall_at_k(reference["neighbours"], result["neighbours"])
+        result["max_cosine_drift"] = float(1 - np.min(np.sum(reference["vectors"] * result["vectors"], axis=1)))
+    for result in backends.values():
+        del result["neighbours"], result["vectors"]
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "settings": {
+            "model": args.model,
+            "reference": args.reference,
+            "documents": len(corpus),
+            "k": k,
+            "rounds": args.rounds
+        },
+        "backends": backends
+    }
+
+    print_summary(results)
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"[BENCH] Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
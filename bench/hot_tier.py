@@ -0,0 +1,117 @@
+import argparse
+import json
+import platform
+import tempfile
+import time
+from typing import Any
+
+import chromadb
+import numpy as np
+
+from app.ai.hot_index import HotIndex
+from bench.run_benchmark import git_revision, percentiles
+
+
+def normalized(vectors: np.ndarray) -> np.ndarray:
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall latency of the in-process hot tier against Chroma-only lookups")
+    parser.add_argument("--documents", type=int, default=20000, help="Entries in the cold Chroma collection")
+    parser.add_argument("--hot", type=int, default=1024, help="Hot tier capacity")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--hot-share", type=float, default=0.8,
+                        help="Fraction of queries aimed at entries that live in the hot tier")
+    parser.add_argument("--cluster-size", type=int, default=16, help="Entries per synthetic topic")
+    parser.add_argument("--spread", type=float, default=0.5, help="Entry perturbation around its topic centre")
+    parser.add_argument("--noise", type=float, default=0.3, help="Query perturbation around the topic centre")
+    parser.add_argument("--skip-distance", type=float, default=0.3,
+                        help="Answer from the hot tier alone when its k-th hit is this close (hot_tier_skip_distance)")
+    parser.add_argument("--output", default="bench_hot_tier.json")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centres = normalized(rng.standard_normal((args.documents // args.cluster_size, args.dim)))
+    topics = np.arange(args.documents) // args.cluster_size % len(centres)
+    noise = rng.standard_normal((args.documents, args.dim)) / np.sqrt(args.dim)
+    vectors = normalized(centres[topics] + args.spread * noise)
+    ids = [f"m{i}" for i in range(args.documents)]
+
+    client = chromadb.PersistentClient(tempfile.mkdtemp(prefix="furina-bench-"))
+    collection = client.create_collection("bench_hot_tier", configuration={"hnsw": {"space": "cosine"}})
+    batch = client.get_max_batch_size()
+    for i in range(0, args.documents, batch):
+        collection.add(ids=ids[i:i + batch], embeddings=vectors[i:i + batch], documents=ids[i:i + batch])
+
+    hot = HotIndex(args.hot)
+    for i in range(args.hot):
+        hot.add(ids[i], vectors[i], ids[i], {}, pinned=i < args.hot // 4)
+
+    targets = np.where(
+        rng.random(args.queries) < args.hot_share,
+        rng.integers(0, args.hot, args.queries),
+        rng.integers(0, args.documents, args.queries)
+    )
+    query_noise = rng.standard_normal((args.queries, args.dim)) / np.sqrt(args.dim)
+    queries = normalized(centres[topics[targets]] + args.noise * query_noise)
+
+    def chroma_only(query: np.ndarray) -> list[str]:
+        return collection.query(query_embeddings=[query], n_results=args.k)["ids"][0]
+
+    def two_tier(query: np.ndarray, skip_distance: float) -> tuple[list[str], bool]:
+        found = hot.search(query, args.k)[0]
+        if len(found) == args.k and found[-1]["distance"] <= skip_distance:
+            return [f["id"] for f in found], True
+        cold = collection.query(query_embeddings=[query], n_results=args.k, include=["distances"])
+        merged = {f["id"]: f["distance"] for f in found}
+        for id, distance in zip(cold["ids"][0], cold["distances"][0]):
+            merged.setdefault(id, distance)
+        return sorted(merged, key=merged.__getitem__)[:args.k], False
+
+    exact = vectors @ queries.T
+    truth = [set(np.array(ids)[np.argsort(-exact[:, q])[:args.k]]) for q in range(args.queries)]
+
+    results: dict[str, Any] = {}
+    for name, search in (
+            ("chroma", lambda q: (chroma_only(q), False)),
+            ("hot+chroma", lambda q: two_tier(q, args.skip_distance))
+    ):
+        search(queries[0])
+        samples: list[float] = []
+        hits = 0
+        overlap = 0
+        for i, query in enumerate(queries):
+            t = time.perf_counter()
+            found, from_hot = search(query)
+            samples.append(time.perf_counter() - t)
+            hits += from_hot
+            overlap += len(truth[i] & set(found))
+        results[name] = {
+            "latency": percentiles(samples),
+            "hot_only_share": hits / args.queries,
+            "recall_at_k": overlap / (args.queries * args.k)
+        }
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "settings": vars(args),
+        "results": results
+    }
+    for name, stats in results.items():
+        latency = stats["latency"]
+        print(
+            f"[BENCH] {name}: p50={latency['p50'] * 1000:.2f}ms p95={latency['p95'] * 1000:.2f}ms "
+            f"recall@{args.k}={stats['recall_at_k']:.3f} hot-only={stats['hot_only_share']:.0%}"
+        )
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"[BENCH] Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
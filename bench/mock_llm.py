@@ -0,0 +1,184 @@
+import argparse
+import asyncio
+from dataclasses import dataclass, field
+import itertools
+import json
+import time
+from typing import Any
+
+
+@dataclass
+class MockSettings:
+    latency: float = 0.1
+    tokens_per_second: float = 100.0
+    tokens: int = 64
+    token: str = "lorem "
+    tool_calls: list[dict[str, Any]] = field(default_factory=list)
+
+
+class MockLLMServer:
+    def __init__(self, settings: MockSettings, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.settings = settings
+        self.host = host
+        self.port = port
+        self.server: asyncio.Server | None = None
+        self.requests = 0
+        self._ids = itertools.count()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1/chat/completions"
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        print(f"[MOCK LLM] Listening on {self.url}")
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def _tool_calls_for(self, body: dict[str, Any]) -> list[dict[str, Any]]:
+        if not body.get("tools") or not self.settings.tool_calls:
+            return []
+        if any(m.get("role") == "tool" for m in body.get("messages", [])):
+            return []
+        return [
+            {
+                "id": f"call_{next(self._ids)}",
+                "type": "function",
+                "function": {"name": call["name"], "arguments": json.dumps(call.get("arguments", {}))}
+            }
+            for call in self.settings.tool_calls
+        ]
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                headers: dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", "0"))
+                raw = await reader.readexactly(length) if length else b"{}"
+                self.requests += 1
+
+                body = json.loads(raw)
+                await asyncio.sleep(self.settings.latency)
+                if body.get("stream"):
+                    await self._stream(body, writer)
+                else:
+                    await self._complete(body, writer)
+
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _complete(self, body: dict[str, Any], writer: asyncio.StreamWriter):
+        tool_calls = self._tool_calls_for(body)
+        if tool_calls:
+            message = {"role": "assistant", "content": None, "tool_calls": tool_calls}
+        else:
+            await asyncio.sleep(self.settings.tokens / self.settings.tokens_per_second)
+            message = {"role": "assistant", "content": self.settings.token * self.settings.tokens}
+
+        payload = json.dumps({
+            "id": f"mock-{next(self._ids)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_calls else "stop"}]
+        }).encode()
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+            + f"Content-Length: {len(payload)}\r\n\r\n".encode()
+            + payload
+        )
+        await writer.drain()
+
+    async def _write_event(self, writer: asyncio.StreamWriter, data: str):
+        event = f"data: {data}\n\n".encode()
+        writer.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+        await writer.drain()
+
+    async def _stream(self, body: dict[str, Any], writer: asyncio.StreamWriter):
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\nTransfer-Encoding: chunked\r\n\r\n"
+        )
+
+        tool_calls = self._tool_calls_for(body)
+        if tool_calls:
+            for index, call in enumerate(tool_calls):
+                delta = {"tool_calls": [{"index": index, **call}]}
+                await self._write_event(writer, json.dumps({"choices": [{"index": 0, "delta": delta}]}))
+            await self._write_event(
+                writer, json.dumps({"choices": [{"index": 0, "delta": {}, "finish_reason": "tool_calls"}]})
+            )
+        else:
+            interval = 1 / self.settings.tokens_per_second
+            for _ in range(self.settings.tokens):
+                delta = {"content": self.settings.token}
+                await self._write_event(writer, json.dumps({"choices": [{"index": 0, "delta": delta}]}))
+                await asyncio.sleep(interval)
+            await self._write_event(
+                writer, json.dumps({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            )
+
+        await self._write_event(writer, "[DONE]")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+def parse_tool_call(value: str) -> dict[str, Any]:
+    name, _, arguments = value.partition(":")
+    return {"name": name, "arguments": json.loads(arguments) if arguments else {}}
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds before the first byte of a response")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--tokens", type=int, default=64, help="Tokens per completion")
+    parser.add_argument(
+        "--tool-call", action="append", default=[], type=parse_tool_call,
+        help="Scripted tool call as NAME or NAME:{json arguments}, may be repeated"
+    )
+
+
+def settings_from_args(args: argparse.Namespace) -> MockSettings:
+    return MockSettings(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        tokens=args.tokens,
+        tool_calls=args.tool_call
+    )
+
+
+async def serve(args: argparse.Namespace):
+    server = MockLLMServer(settings_from_args(args), args.host, args.port)
+    await server.start()
+    assert server.server is not None
+    await server.server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the /v1/chat/completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    add_arguments(parser)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,201 @@
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import subprocess
+import time
+from typing import Any
+
+from bench.mock_llm import MockLLMServer, add_arguments, settings_from_args
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "mean": statistics.fmean(ordered),
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": ordered[-1]
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def monitor_loop_lag(samples: list[float], interval: float, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - start - interval))
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    from app.ai.http_pool import close_http_clients
+    from app.companion.context_provider import get_context
+    from app.companion.token_budget import estimate_tokens
+    from app.config import config
+
+    mock = None
+    url = args.url
+    if url is None:
+        mock = MockLLMServer(settings_from_args(args))
+        await mock.start()
+        url = mock.url
+
+    for conf in config.companions.values():
+        conf.ai_api_url = url
+        conf.ai_endpoints = []
+        conf.cache_enabled = args.cache
+
+    companions, ctx = get_context()
+    await asyncio.gather(*(c.memory.start() for c in companions.values()))
+    key = args.companion or next(iter(companions))
+    companion_name = companions[key].config.ai_name
+
+    payload = json.dumps({
+        "companion_name": companion_name,
+        "user_prompt": args.prompt,
+        "system_prompt": "",
+        "use_personality": True,
+        "allow_memory_lookup": args.memory,
+        "allow_memory_insertion": args.memory,
+        "source": "benchmark",
+        "metadata": {},
+        "max_tokens": args.max_tokens,
+        "stream": args.stream
+    })
+
+    latencies: list[float] = []
+    ttfts: list[float] = []
+    tokens: list[int] = []
+    errors: list[str] = []
+    lag: list[float] = []
+    remaining = iter(range(args.requests))
+
+    async def one_request():
+        start = time.perf_counter()
+        if args.stream:
+            first = None
+            parts: list[str] = []
+            async for chunk in ctx["handle_stream"](payload):
+                if first is None:
+                    first = time.perf_counter() - start
+                parts.append(chunk)
+            if first is not None:
+                ttfts.append(first)
+            text = "".join(parts)
+        else:
+            text = await ctx["handle"](payload)
+        latencies.append(time.perf_counter() - start)
+        tokens.append(estimate_tokens(text))
+
+    async def worker():
+        for _ in remaining:
+            try:
+                await one_request()
+            except Exception as e:
+                errors.append(repr(e))
+
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop_lag(lag, args.lag_interval, stop))
+
+    for _ in range(args.warmup):
+        await one_request()
+    latencies.clear()
+    ttfts.clear()
+    tokens.clear()
+    lag.clear()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    wall = time.perf_counter() - started
+
+    stop.set()
+    await monitor
+    await close_http_clients()
+    if mock is not None:
+        await mock.stop()
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "settings": {
+            "mode": "stream" if args.stream else "complete",
+            "companion": companion_name,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "memory": args.memory,
+            "cache": args.cache,
+            "url": url if args.url else "mock",
+            "mock_latency": None if args.url else args.latency,
+            "mock_tokens_per_second": None if args.url else args.tokens_per_second,
+            "mock_tokens": None if args.url else args.tokens,
+            "mock_tool_calls": None if args.url else [c["name"] for c in args.tool_call]
+        },
+        "completed": len(latencies),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "wall_time": wall,
+        "requests_per_second": len(latencies) / wall if wall else 0.0,
+        "tokens_per_second": sum(tokens) / wall if wall else 0.0,
+        "upstream_requests": mock.requests if mock is not None else None,
+        "latency": percentiles(latencies),
+        "ttft": percentiles(ttfts),
+        "event_loop_lag": percentiles(lag)
+    }
+
+
+def print_summary(result: dict[str, Any]):
+    print(f"[BENCH] {result['completed']} requests, {result['errors']} errors in {result['wall_time']:.2f}s")
+    print(f"[BENCH] {result['requests_per_second']:.1f} req/s, {result['tokens_per_second']:.1f} tokens/s")
+    for name in ("latency", "ttft", "event_loop_lag"):
+        stats = result[name]
+        if stats["count"]:
+            print(
+                f"[BENCH] {name}: p50={stats['p50'] * 1000:.1f}ms p95={stats['p95'] * 1000:.1f}ms "
+                f"p99={stats['p99'] * 1000:.1f}ms max={stats['max'] * 1000:.1f}ms"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end latency/throughput benchmark for get_context() handlers")
+    parser.add_argument("--url", default=None, help="Benchmark against this endpoint instead of the bundled mock")
+    parser.add_argument("--companion", default=None, help="Companion key from config.yml (default: first)")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--stream", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--memory", action=argparse.BooleanOptionalAction, default=False,
+                        help="Enable memory lookup and insertion (exercises Chroma)")
+    parser.add_argument("--cache", action=argparse.BooleanOptionalAction, default=False)
+    parser.add_argument("--prompt", default="How was your day at the Opera Epiclese?")
+    parser.add_argument("--max-tokens", type=int, default=256)
+    parser.add_argument("--lag-interval", type=float, default=0.01)
+    parser.add_argument("--output", default="bench_results.json")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print_summary(result)
+    with open(args.output, "w") as file:
+        json.dump(result, file, indent=2)
+    print(f"[BENCH] Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+import asyncio
+import base64
+import hashlib
+from http import HTTPStatus
+import json
+import os
+import struct
+from typing import Any
+
+from app import telemetry
+from app.config import config
+from app.models.codec import HandlerError
+from app.models.schema import GatewayConfig
+
+
+WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC11B85"
+MAX_HEADER_BYTES = 16 * 1024
+SSE_HEADERS = b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\nConnection: close\r\n\r\n"
+
+connections_rejected = telemetry.counter("furina_gateway_rejected_total", "Gateway connections refused at the connection limit")
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def _status_line(status: int) -> str:
+    try:
+        return f"{status} {HTTPStatus(status).phrase}"
+    except ValueError:
+        return f"{status} Error"
+
+
+def _unmask(payload: bytes, mask: bytes) -> bytes:
+    n = len(payload)
+    key = (mask * (n // 4 + 1))[:n]
+    return (int.from_bytes(payload, "little") ^ int.from_bytes(key, "little")).to_bytes(n, "little")
+
+
+def _ws_frame(opcode: int, payload: bytes) -> bytes:
+    n = len(payload)
+    if n < 126:
+        header = struct.pack("!BB", 0x80 | opcode, n)
+    elif n < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, n)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, n)
+    return header + payload
+
+
+class Connection:
+    """One client socket with its own read buffer and serialized writes.
+
+    Every write waits for the transport to drain, so a slow client stalls the
+    writers, which in turn stop pulling chunks from the upstream stream.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.buffer = bytearray()
+        self.write_lock = asyncio.Lock()
+
+    async def _fill(self) -> bool:
+        data = await self.reader.read(65536)
+        if not data:
+            return False
+        self.buffer += data
+        return True
+
+    async def read_until(self, separator: bytes, limit: int) -> bytes | None:
+        while True:
+            end = self.buffer.find(separator)
+            if end != -1:
+                data = bytes(self.buffer[:end])
+                del self.buffer[:end + len(separator)]
+                return data
+            if len(self.buffer) > limit:
+                raise ProtocolError("Header too large")
+            if not await self._fill():
+                return None
+
+    async def read_exactly(self, n: int) -> bytes | None:
+        while len(self.buffer) < n:
+            if not await self._fill():
+                return None
+        data = bytes(self.buffer[:n])
+        del self.buffer[:n]
+        return data
+
+    async def send(self, data: bytes):
+        async with self.write_lock:
+            self.writer.write(data)
+            await self.writer.drain()
+
+    async def watch(self, task: asyncio.Task[Any], limit: int):
+        # Cancels `task` when the peer hangs up. Pipelined bytes stay buffered
+        # for the next request.
+        while len(self.buffer) <= limit:
+            if not await self._fill():
+                task.cancel()
+                return
+
+
+class Gateway:
+    """HTTP and WebSocket front end for the context handlers.
+
+    Routes:
+      POST /complete  PromptMessage JSON -> text/plain response
+      POST /stream    PromptMessage JSON -> text/event-stream, one `data:` event per chunk
+      GET  /ws        WebSocket; text frames are PromptMessage JSON with an extra `id`.
+                      Streams run concurrently and are answered as {"id", "chunk"} frames
+                      followed by {"id", "done": true}. {"id", "cancel": true} stops one.
+      GET  /health
+
+    Handler failures surface as a 502 on /complete, an `error` event on /stream
+    and an {"id", "error"} frame on /ws. A request the handlers refuse before
+    streaming (HandlerError) gets its own status instead: as the response status
+    on /stream, whose headers wait for the first chunk, and as a `status` field
+    on /ws.
+
+    A client that disconnects mid-response cancels its streams, and at most
+    `max_connections` sockets are served at once.
+    """
+
+    def __init__(self, conf: GatewayConfig, ctx: dict[str, Any]) -> None:
+        self.conf = conf
+        self.handle = ctx["handle"]
+        self.handle_stream = ctx["handle_stream"]
+        self.active = 0
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        conn = Connection(reader, writer)
+        if self.active >= self.conf.max_connections:
+            connections_rejected.inc()
+            await self._respond(conn, "503 Service Unavailable", b"too many connections\n", close=True)
+            writer.close()
+            return
+
+        self.active += 1
+        try:
+            while await self._request(conn):
+                pass
+        except ProtocolError as e:
+            await self._respond(conn, "400 Bad Request", f"{e}\n".encode(), close=True)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            print(f"[GATEWAY] [ERROR] Connection failed: {type(e).__name__}: {e}")
+        finally:
+            self.active -= 1
+            writer.close()
+
+    async def _respond(self, conn: Connection, status: str, body: bytes, content_type: str = "text/plain; charset=utf-8", close: bool = False):
+        try:
+            await conn.send(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n".encode() + body
+            )
+        except ConnectionError:
+            pass
+
+    async def _request(self, conn: Connection) -> bool:
+        head = await conn.read_until(b"\r\n\r\n", MAX_HEADER_BYTES)
+        if head is None:
+            return False
+
+        lines = head.decode("latin-1").split("\r\n")
+        parts = lines[0].split()
+        if len(parts) != 3:
+            raise ProtocolError("Malformed request line")
+        method, target, version = parts
+        headers: dict[str, str] = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        path = target.split("?")[0]
+
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            await self._respond(conn, "411 Length Required", b"chunked request bodies are not supported\n", close=True)
+            return False
+        try:
+            length = int(headers.get("content-length", "0") or 0)
+        except ValueError:
+            raise ProtocolError("Malformed Content-Length")
+        if length < 0:
+            raise ProtocolError("Malformed Content-Length")
+        if length > self.conf.max_body_bytes:
+            await self._respond(conn, "413 Content Too Large", b"request body too large\n", close=True)
+            return False
+        body = await conn.read_exactly(length) if length else b""
+        if body is None:
+            return False
+        keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+        if method == "GET" and path == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+            await self._websocket(conn, headers)
+            return False
+        if method == "GET" and path == "/health":
+            await self._respond(conn, "200 OK", b"ok\n", close=not keep_alive)
+        elif method == "POST" and path == "/complete":
+            try:
+                response = await self._guarded(conn, self.handle(body))
+            except Exception as e:
+                print(f"[GATEWAY] [ERROR] /complete failed: {type(e).__name__}: {e}")
+                await self._respond(conn, "502 Bad Gateway", f"{type(e).__name__}: {e}\n".encode(), close=not keep_alive)
+                return keep_alive
+            if response is None:
+                return False
+            await self._respond(conn, "200 OK", response.encode(), close=not keep_alive)
+        elif method == "POST" and path == "/stream":
+            await self._sse(conn, body)
+            return False
+        else:
+            await self._respond(conn, "404 Not Found", b"not found\n", close=not keep_alive)
+        return keep_alive
+
+    async def _guarded(self, conn: Connection, work: Any) -> Any:
+        task = asyncio.ensure_future(work)
+        watcher = asyncio.create_task(conn.watch(task, self.conf.max_body_bytes))
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if task.cancelled() and not watcher.done():
+                raise
+            return None
+        finally:
+            watcher.cancel()
+            await asyncio.gather(watcher, return_exceptions=True)
+
+    async def _sse(self, conn: Connection, body: bytes):
+        async def stream():
+            # Headers wait for the first chunk, so a refused request still gets its own status.
+            started = False
+            error = None
+            try:
+                async for chunk in self.handle_stream(body):
+                    if not started:
+                        started = True
+                        await conn.send(SSE_HEADERS)
+                    await conn.send(b"data: " + json.dumps(chunk).encode() + b"\n\n")
+            except ConnectionError:
+                raise
+            except HandlerError as e:
+                if not started:
+                    await self._respond(conn, _status_line(e.status), f"{e}\n".encode(), close=True)
+                    return
+                error = str(e)
+            except Exception as e:
+                print(f"[GATEWAY] [ERROR] /stream failed: {type(e).__name__}: {e}")
+                error = f"{type(e).__name__}: {e}"
+
+            if not started:
+                await conn.send(SSE_HEADERS)
+            if error is not None:
+                await conn.send(b"event: error\ndata: " + json.dumps(error).encode() + b"\n\n")
+            else:
+                await conn.send(b"event: done\ndata: \n\n")
+
+        await self._guarded(conn, stream())
+
+    async def _websocket(self, conn: Connection, headers: dict[str, str]):
+        key = headers.get("sec-websocket-key")
+        if key is None:
+            raise ProtocolError("Missing Sec-WebSocket-Key")
+        accept = base64.b64encode(hashlib.sha1(key.encode() + WS_GUID).digest()).decode()
+        await conn.send(
+            "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode()
+        )
+
+        streams: dict[str, asyncio.Task[None]] = {}
+        try:
+            while True:
+                message = await self._ws_read(conn)
+                if message is None:
+                    break
+                try:
+                    request = json.loads(message)
+                    stream_id = str(request["id"])
+                except (ValueError, KeyError, TypeError):
+                    await self._ws_send(conn, {"error": "Frames must be JSON objects with an `id`"})
+                    continue
+
+                if request.get("cancel"):
+                    task = streams.pop(stream_id, None)
+                    if task is not None:
+                        task.cancel()
+                    continue
+                if stream_id in streams:
+                    await self._ws_send(conn, {"id": stream_id, "error": "Stream id already in use"})
+                    continue
+                if len(streams) >= self.conf.max_streams_per_connection:
+                    await self._ws_send(conn, {"id": stream_id, "error": "Too many concurrent streams"})
+                    continue
+
+                streams[stream_id] = asyncio.create_task(self._ws_stream(conn, streams, stream_id, message))
+        finally:
+            for task in streams.values():
+                task.cancel()
+            await asyncio.gather(*streams.values(), return_exceptions=True)
+
+    async def _ws_stream(self, conn: Connection, streams: dict[str, asyncio.Task[None]], stream_id: str, message: bytes):
+        try:
+            async for chunk in self.handle_stream(message):
+                await self._ws_send(conn, {"id": stream_id, "chunk": chunk})
+            await self._ws_send(conn, {"id": stream_id, "done": True})
+        except ConnectionError:
+            pass
+        except HandlerError as e:
+            try:
+                await self._ws_send(conn, {"id": stream_id, "error": str(e), "status": e.status})
+            except ConnectionError:
+                pass
+        except Exception as e:
+            print(f"[GATEWAY] [ERROR] Stream {stream_id} failed: {type(e).__name__}: {e}")
+            try:
+                await self._ws_send(conn, {"id": stream_id, "error": f"{type(e).__name__}: {e}"})
+            except ConnectionError:
+                pass
+        finally:
+            if streams.get(stream_id) is asyncio.current_task():
+                del streams[stream_id]
+
+    async def _ws_send(self, conn: Connection, payload: dict[str, Any]):
+        await conn.send(_ws_frame(0x1, json.dumps(payload).encode()))
+
+    async def _ws_read(self, conn: Connection) -> bytes | None:
+        fragments: list[bytes] = []
+        size = 0
+        while True:
+            header = await conn.read_exactly(2)
+            if header is None:
+                return None
+            fin, opcode = header[0] & 0x80, header[0] & 0x0F
+            if not header[1] & 0x80:
+                raise ProtocolError("Client frames must be masked")
+            length = header[1] & 0x7F
+            if length >= 126:
+                extended = await conn.read_exactly(2 if length == 126 else 8)
+                if extended is None:
+                    return None
+                length = int.from_bytes(extended, "big")
+            size += length
+            if size > self.conf.max_body_bytes:
+                raise ProtocolError("WebSocket message too large")
+
+            mask = await conn.read_exactly(4)
+            payload = await conn.read_exactly(length) if length else b""
+            if mask is None or payload is None:
+                return None
+            payload = _unmask(payload, mask)
+
+            if opcode == 0x8:
+                await conn.send(_ws_frame(0x8, payload[:2]))
+                return None
+            if opcode == 0x9:
+                await conn.send(_ws_frame(0xA, payload))
+                size -= length
+                continue
+            if opcode == 0xA:
+                size -= length
+                continue
+
+            fragments.append(payload)
+            if fin:
+                return b"".join(fragments)
+
+
+async def start(ctx: dict[str, Any]) -> asyncio.Task[None]:
+    conf = config.gateway
+    if not conf.enabled:
+        print("[GATEWAY] Disabled in config.")
+        return asyncio.create_task(asyncio.sleep(0))
+
+    gateway = Gateway(conf, ctx)
+    telemetry.gauge(
+        "furina_gateway_connections",
+        "Open gateway connections",
+        lambda: {(): gateway.active}
+    )
+
+    if conf.unix_socket is not None:
+        if os.path.exists(conf.unix_socket):
+            os.unlink(conf.unix_socket)
+        server = await asyncio.start_unix_server(gateway.serve, conf.unix_socket)
+        print(f"[GATEWAY] Listening on unix:{conf.unix_socket}")
+    else:
+        server = await asyncio.start_server(gateway.serve, conf.host, conf.port, backlog=conf.max_connections)
+        port = server.sockets[0].getsockname()[1]
+        print(f"[GATEWAY] Listening on http://{conf.host}:{port}")
+
+    async def run():
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if conf.unix_socket is not None and os.path.exists(conf.unix_socket):
+                os.unlink(conf.unix_socket)
+
+    return asyncio.create_task(run())
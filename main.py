@@ -1,15 +1,29 @@
+import argparse
 import asyncio
+import os
 import signal
 import sys
+import time
 from asyncio.tasks import Task
 from typing import Any
 
+from app import telemetry
+from app.ai.embedding import warm_up_embeddings
+from app.ai.http_pool import close_http_clients
+from app.ai.memory import shutdown_memory_executor
+from app.ai.memory_lifecycle import MemoryLifecycle
+from app.ai.tool_runner import shutdown_tool_executors
+from app.cluster.router import Router
+from app.cluster.supervisor import Supervisor
+from app.cluster.worker import owner, start_worker_server
 from app.companion.companion import Companion
 from app.companion.context_provider import get_context
+from app.companion.reflection import ReflectionPool
+from app.config import config
 from app.loaders.entrypoint_loader import load_entrypoints
 
 terminate = False
-reflect_interval = 5
+sweep_interval = 5
 
 def kill(sig, frame):
     global terminate
@@ -19,33 +33,135 @@ def kill(sig, frame):
 signal.signal(signal.SIGINT, kill)
 signal.signal(signal.SIGTERM, kill)
 
-async def run_reflection_loop(companion: Companion):
+async def run_session_sweeper(companion: Companion):
     try:
         while not terminate:
-            await companion.reflect()
-            await asyncio.sleep(reflect_interval)
+            await companion.sessions.evict_idle()
+            await companion.sessions.maybe_checkpoint()
+            await asyncio.sleep(sweep_interval)
     except asyncio.CancelledError:
         pass
 
-async def main():
+async def run_memory_counter(companions: list[Companion]):
+    # Counting a collection is a Chroma round trip, so the gauge reads a cached
+    # count that is refreshed here instead of on every scrape.
+    try:
+        while not terminate:
+            await asyncio.sleep(config.metrics.refresh_interval)
+            await asyncio.gather(*(c.memory.refresh_count() for c in companions))
+    except asyncio.CancelledError:
+        pass
+
+async def start_metrics(port_offset: int = 0):
+    if not config.metrics.enabled:
+        return None
+    telemetry.configure(True)
+    if config.metrics.log_spans:
+        telemetry.add_exporter(telemetry.LogExporter())
+    if config.metrics.port is None:
+        return None
+    return await telemetry.start_metrics_server(config.metrics.host, config.metrics.port + port_offset)
+
+def assign_companions(worker: int, processes: int):
+    # Shard mode keeps only the companions this worker owns. Replicated
+    # companions get per-worker session directories, since the router pins
+    # each conversation to one worker.
+    if config.workers.mode == "shard":
+        config.companions = {
+            name: conf for name, conf in config.companions.items()
+            if owner(conf.ai_name, processes) == worker
+        }
+    else:
+        for conf in config.companions.values():
+            conf.session_dir = os.path.join(conf.session_dir, f"worker-{worker}")
+
+async def supervise(processes: int):
+    metrics_server = await start_metrics()
+    supervisor = Supervisor(config, processes, os.path.abspath(__file__))
+    tasks: list[Task[Any]] = []
+    try:
+        await supervisor.start()
+        tasks = await load_entrypoints(Router(config.workers, processes, config.companions).context())
+        tasks.append(asyncio.create_task(supervisor.monitor()))
+        print(f"[MAIN] Supervising {processes} workers in {config.workers.mode} mode.")
+
+        while not terminate:
+            await asyncio.sleep(0.1)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await supervisor.stop()
+        if metrics_server is not None:
+            metrics_server.close()
+
+        sys.exit(0)
+
+async def main(worker: int | None = None, processes: int = 1):
+    metrics_server = await start_metrics(0 if worker is None else worker + 1)
+
+    started = time.perf_counter()
+    if worker is not None:
+        assign_companions(worker, processes)
     companions, ctx = get_context()
-    tasks: list[Task[Any]] = await load_entrypoints(ctx)
+    reflection = ReflectionPool(config.reflection.workers)
+    for companion in companions.values():
+        reflection.register(companion)
+        await companion.recover()
+    warm_up_embeddings()
+    if worker is None:
+        tasks: list[Task[Any]] = await load_entrypoints(ctx)
+    else:
+        tasks = [await start_worker_server(ctx, worker, config.workers.socket_dir)]
+    print(f"[MAIN] Accepting traffic {time.perf_counter() - started:.2f}s after startup.")
 
-    reflection_tasks = [
-        asyncio.create_task(run_reflection_loop(companions[c]))
-        for c in companions
+    # With replicated companions only one worker maintains each shared collection.
+    # The others cannot see its merges, evictions or base-memory rewrites, so
+    # they read from Chroma directly rather than from a hot tier that would go stale.
+    maintained = [
+        c for c in companions.values()
+        if worker is None or config.workers.mode == "shard" or owner(c.config.ai_name, processes) == worker
     ]
-    tasks.extend(reflection_tasks)
+    for companion in companions.values():
+        if companion not in maintained:
+            companion.memory.hot = None
+    tasks.extend(asyncio.create_task(c.memory.start(sync=c in maintained)) for c in companions.values())
+    tasks.extend(asyncio.create_task(MemoryLifecycle(c.memory).run()) for c in maintained)
+
+    tasks.extend(reflection.start())
+    tasks.extend(asyncio.create_task(run_session_sweeper(companions[c])) for c in companions)
+    if config.metrics.enabled:
+        tasks.append(asyncio.create_task(run_memory_counter(list(companions.values()))))
 
     try:
         while not terminate:
             await asyncio.sleep(0.1)
     finally:
+        reflection.stop()
         for task in tasks:
             task.cancel()
 
         await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.gather(*(c.memory.flush() for c in companions.values()), return_exceptions=True)
+        await asyncio.gather(*(c.sessions.close() for c in companions.values()), return_exceptions=True)
+        if metrics_server is not None:
+            metrics_server.close()
+        await close_http_clients()
+        for companion in companions.values():
+            companion.ai_client.close()
+        shutdown_tool_executors()
+        shutdown_memory_executor()
 
         sys.exit(0)
 
-asyncio.run(main())
+parser = argparse.ArgumentParser(description="Run the companions")
+parser.add_argument("--workers", type=int, default=config.workers.processes, help="Worker processes; more than one starts the supervisor")
+parser.add_argument("--worker", type=int, default=None, help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+if args.worker is not None:
+    asyncio.run(main(args.worker, args.workers))
+elif args.workers > 1:
+    asyncio.run(supervise(args.workers))
+else:
+    asyncio.run(main())
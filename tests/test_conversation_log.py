@@ -0,0 +1,36 @@
+import asyncio
+
+from app.companion.conversation_log import ConversationLog
+
+
+def test_replay_starts_after_the_checkpoint_and_skips_a_torn_tail(tmp_path):
+    async def run():
+        log = ConversationLog(tmp_path, 64)
+        for i in range(3):
+            log.append({"n": i})
+        log.write_checkpoint(await log.write())
+        for i in range(3, 10):
+            log.append({"n": i})
+        await log.write()
+        log.close()
+        with open(log._path(log.segment), "ab") as file:
+            file.write(b'{"n":10')
+
+    asyncio.run(run())
+    assert [record["n"] for record in ConversationLog(tmp_path, 64).replay()] == list(range(3, 10))
+
+
+def test_compaction_keeps_the_checkpointed_segment(tmp_path):
+    async def run():
+        log = ConversationLog(tmp_path, 16)
+        for i in range(6):
+            log.append({"n": i})
+            position = await log.write()
+        log.write_checkpoint(position)
+        log.compact(position)
+        log.close()
+        return position
+
+    segment, _ = asyncio.run(run())
+    assert ConversationLog(tmp_path, 16)._segments()[0] == segment
+    assert ConversationLog(tmp_path, 16).replay() == []
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "entrypoints"))
+
+import gateway
+from app.models.codec import HandlerError
+from app.models.schema import GatewayConfig
+
+
+async def handle(message: bytes) -> str:
+    return "ok"
+
+
+async def handle_stream(message: bytes):
+    request = json.loads(message)
+    if request.get("companion_name") == "missing":
+        raise HandlerError(404, "Companion 'missing' not found.")
+    for word in ("a", "b"):
+        yield word
+
+
+async def serve(stream=handle_stream, **conf):
+    ctx = {"handle": handle, "handle_stream": stream}
+    server = await asyncio.start_server(gateway.Gateway(GatewayConfig(port=0, **conf), ctx).serve, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+async def post(port: int, path: str, body: bytes) -> bytes:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"POST {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+    response = await reader.read()
+    writer.close()
+    return response
+
+
+async def ws_exchange(port: int, payloads: list[dict], replies: int) -> list[dict]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /ws HTTP/1.1\r\nUpgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n\r\n")
+    await reader.readuntil(b"\r\n\r\n")
+    mask = b"\x01\x02\x03\x04"
+    for payload in payloads:
+        data = json.dumps(payload).encode()
+        writer.write(bytes([0x81, 0x80 | len(data)]) + mask + gateway._unmask(data, mask))
+
+    frames = []
+    for _ in range(replies):
+        header = await reader.readexactly(2)
+        frames.append(json.loads(await reader.readexactly(header[1] & 0x7F)))
+    writer.close()
+    return frames
+
+
+def test_refused_stream_gets_its_status():
+    async def run():
+        server, port = await serve()
+        async with server:
+            refused = await post(port, "/stream", b'{"companion_name": "missing"}')
+            streamed = await post(port, "/stream", b'{"companion_name": "furina"}')
+        return refused, streamed
+
+    refused, streamed = asyncio.run(run())
+    assert refused.startswith(b"HTTP/1.1 404 Not Found\r\n")
+    assert b"not found" in refused
+    assert streamed.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert streamed.endswith(b'data: "a"\n\ndata: "b"\n\nevent: done\ndata: \n\n')
+
+
+def test_refused_ws_stream_gets_an_error_frame():
+    async def run():
+        server, port = await serve()
+        async with server:
+            return await ws_exchange(port, [{"id": 1, "companion_name": "missing"}], 1)
+
+    frames = asyncio.run(run())
+    assert frames == [{"id": "1", "error": "Companion 'missing' not found.", "status": 404}]
+
+
+def test_ws_multiplexes_streams():
+    async def run():
+        server, port = await serve()
+        async with server:
+            return await ws_exchange(port, [{"id": 1, "companion_name": "furina"}, {"id": 2, "companion_name": "furina"}], 6)
+
+    frames = asyncio.run(run())
+    for stream_id in ("1", "2"):
+        replies = [f for f in frames if f["id"] == stream_id]
+        assert replies == [{"id": stream_id, "chunk": "a"}, {"id": stream_id, "chunk": "b"}, {"id": stream_id, "done": True}]
+
+
+def test_client_disconnect_cancels_the_stream():
+    cancelled = asyncio.Event()
+
+    async def endless(message: bytes):
+        try:
+            yield "first"
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def run():
+        server, port = await serve(endless)
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"POST /stream HTTP/1.1\r\nContent-Length: 2\r\n\r\n{}")
+            await reader.readuntil(b'data: "first"\n\n')
+            writer.close()
+            await asyncio.wait_for(cancelled.wait(), 5)
+
+    asyncio.run(run())
+
+
+def test_connections_over_the_limit_are_refused():
+    async def run():
+        server, port = await serve(max_connections=1)
+        async with server:
+            _, held = await asyncio.open_connection("127.0.0.1", port)
+            await asyncio.sleep(0.05)
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            refused = await reader.read()
+            writer.close()
+            held.close()
+            await asyncio.sleep(0.05)
+            accepted = await post(port, "/complete", b"{}")
+        return refused, accepted
+
+    refused, accepted = asyncio.run(run())
+    assert refused.startswith(b"HTTP/1.1 503 ")
+    assert accepted.startswith(b"HTTP/1.1 200 OK\r\n") and accepted.endswith(b"ok")
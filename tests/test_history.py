@@ -0,0 +1,26 @@
+from app.companion.history import ConversationHistory
+
+
+def filled(capacity: int, turns: int, reflected: int) -> ConversationHistory:
+    history = ConversationHistory("A", capacity, 1000)
+    for i in range(turns):
+        history.append("user", f"turn {i}")
+    history.mark_reflected(reflected)
+    return history
+
+
+def test_round_trip_keeps_history():
+    history = filled(4, 10, 3)
+    restored = ConversationHistory.from_state("A", 4, 1000, history.to_state())
+    assert restored.appended == history.appended
+    assert restored.reflected == history.reflected
+    assert restored.pending_text() == history.pending_text()
+    assert restored.render(1000) == history.render(1000)
+
+
+def test_round_trip_into_smaller_capacity_keeps_turn_order():
+    history = filled(4, 10, 3)
+    restored = ConversationHistory.from_state("A", 2, 1000, history.to_state())
+    assert len(restored) == 2
+    assert restored.pending_text() == history.pending_text()
+    assert restored.pending_text() == "".join(f"turn {i}\n" for i in range(3, 10))
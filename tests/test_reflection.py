@@ -0,0 +1,64 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.companion.history import ConversationHistory
+from app.companion.reflection import ReflectionPool
+from app.companion.session import Session
+
+
+class SlowCompanion:
+    def __init__(self) -> None:
+        self.config = SimpleNamespace(
+            ai_name="A",
+            collection_name="c",
+            reflection_min_batch=1,
+            reflection_debounce=0.01,
+            reflection_max_delay=0.05
+        )
+        self.reflector = None
+        self.running = 0
+        self.max_running = 0
+        self.memories: list[str] = []
+
+    async def reflect_session(self, session: Session):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            reflected = session.history.appended
+            text = session.history.pending_text()
+            await asyncio.sleep(0.1)
+            self.memories.extend(text.splitlines())
+            session.history.mark_reflected(reflected)
+        finally:
+            self.running -= 1
+
+
+def test_session_is_never_reflected_concurrently():
+    async def run():
+        pool = ReflectionPool(workers=2)
+        companion = SlowCompanion()
+        session = Session("u/s", ConversationHistory("A", 100, 100))
+        tasks = pool.start()
+
+        for i in range(3):
+            session.history.append("user", f"early{i}")
+            pool.notify(companion, session)
+        await asyncio.sleep(0.05)
+        for i in range(3):
+            session.history.append("user", f"late{i}")
+            pool.notify(companion, session)
+            await asyncio.sleep(0.02)
+
+        for _ in range(100):
+            await asyncio.sleep(0.02)
+            if session.history.pending == 0 and not session.scheduled:
+                break
+        pool.stop()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return companion, session
+
+    companion, session = asyncio.run(run())
+    assert companion.max_running == 1
+    assert sorted(companion.memories) == sorted([f"early{i}" for i in range(3)] + [f"late{i}" for i in range(3)])
+    assert session.history.pending == 0
+    assert not session.scheduled
@@ -0,0 +1,26 @@
+import asyncio
+
+from app.ai.response_cache import ResponseCache
+
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def test_stored_responses_survive_a_restart(tmp_path):
+    path = str(tmp_path / "cache.db")
+
+    async def store():
+        cache = ResponseCache(path=path)
+        cache.store(await cache.lookup(MESSAGES, None, 100, upstream=[("u", "m")]), "hi")
+        cache.close()
+
+    async def lookup(upstream):
+        cache = ResponseCache(path=path)
+        try:
+            return (await cache.lookup(MESSAGES, None, 100, upstream=upstream)).response
+        finally:
+            cache.close()
+
+    asyncio.run(store())
+    assert asyncio.run(lookup([("u", "m")])) == "hi"
+    assert asyncio.run(lookup([("u", "other-model")])) is None
@@ -0,0 +1,14 @@
+from app.cluster.router import Router
+from app.config import config
+from app.models.schema import PromptMessage, WorkersConfig
+
+
+def message(user: str | None, source: str) -> PromptMessage:
+    return PromptMessage("Furina", "hi", "", True, True, True, source, {}, 100, True, user)
+
+
+def test_missing_user_routes_like_the_default_user():
+    router = Router(WorkersConfig(processes=64), 64, config.companions)
+    user_name = config.companions["furina"].user_name
+    for source in (f"channel-{i}" for i in range(20)):
+        assert router.route(message(None, source)) == router.route(message(user_name, source))
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from app.ai.scheduler import Priority, RequestScheduler, SchedulerFull, TokenBucket
+
+
+def test_waiters_get_slots_in_priority_order():
+    async def run():
+        scheduler = RequestScheduler(max_concurrency=1, queue_size=10)
+        order: list[Priority] = []
+        release = asyncio.Event()
+
+        async def request(priority: Priority):
+            async with scheduler.slot(priority):
+                order.append(priority)
+                await release.wait()
+
+        first = asyncio.create_task(request(Priority.BATCH))
+        await asyncio.sleep(0)
+        waiting = [asyncio.create_task(request(p)) for p in (Priority.REFLECTION, Priority.BATCH, Priority.INTERACTIVE_STREAM, Priority.INTERACTIVE)]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(first, *waiting)
+        return order
+
+    assert asyncio.run(run()) == [
+        Priority.BATCH, Priority.INTERACTIVE_STREAM, Priority.INTERACTIVE, Priority.REFLECTION, Priority.BATCH
+    ]
+
+
+def test_full_queue_rejects_only_its_priority():
+    async def run():
+        scheduler = RequestScheduler(max_concurrency=1, queue_size=1)
+        hold = asyncio.Event()
+
+        async def request(priority: Priority):
+            async with scheduler.slot(priority):
+                await hold.wait()
+
+        tasks = [asyncio.create_task(request(Priority.REFLECTION)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerFull):
+            await request(Priority.REFLECTION)
+        tasks.append(asyncio.create_task(request(Priority.INTERACTIVE)))
+        await asyncio.sleep(0)
+        stats = scheduler.stats()
+        hold.set()
+        await asyncio.gather(*tasks)
+        return stats
+
+    stats = asyncio.run(run())
+    assert stats["rejected"] == {"interactive_stream": 0, "interactive": 0, "reflection": 1, "batch": 0}
+    assert stats["queued"]["interactive"] == 1
+
+
+def test_rate_limit_serves_the_most_urgent_waiter_first():
+    async def run():
+        bucket = TokenBucket(600)
+        bucket.tokens = 0
+        order: list[int] = []
+
+        async def acquire(priority: int):
+            await bucket.acquire(1, priority)
+            order.append(priority)
+
+        tasks = [asyncio.create_task(acquire(p)) for p in (3, 2, 0)]
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(run()) == [0, 2, 3]
@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+from app.companion.session import SessionStore
+from app.models.schema import CompanionConfig
+
+
+def make_conf(tmp_path, **kw) -> CompanionConfig:
+    return CompanionConfig(
+        ai_name="A",
+        user_name="U",
+        memory_prompt="",
+        memory_recall_count=1,
+        memory_query_message_count=1,
+        ai_api_key="",
+        ai_api_url="",
+        personality_prompt="",
+        collection_name="c",
+        session_dir=str(tmp_path),
+        session_shards=1,
+        **kw
+    )
+
+
+def test_get_during_eviction_keeps_the_live_session(tmp_path):
+    async def run():
+        store = SessionStore(make_conf(tmp_path, session_idle_timeout=0, session_log=False))
+        session = await store.get("u/s")
+        store.append(session, "user", "first")
+        session.last_active = time.monotonic() - 1
+
+        save = store._save
+
+        def slow_save(key, state):
+            time.sleep(0.05)
+            save(key, state)
+
+        store._save = slow_save
+        eviction = asyncio.create_task(store.evict_idle())
+        await asyncio.sleep(0.01)
+        again = await store.get("u/s")
+        store.append(again, "user", "second")
+        await eviction
+        return store, session, again
+
+    store, session, again = asyncio.run(run())
+    assert again is session
+    assert len(store) == 1
+    assert session.history.appended == 2
+
+
+def test_log_records_survive_a_crash(tmp_path):
+    async def write():
+        store = SessionStore(make_conf(tmp_path))
+        await store.recover()
+        session = await store.get("u/s")
+        store.append(session, "user", "hello")
+        store.append(session, "assistant", "hi")
+        await store._writer
+
+    async def recover():
+        store = SessionStore(make_conf(tmp_path))
+        sessions = await store.recover()
+        await store.close()
+        return sessions
+
+    asyncio.run(write())
+    sessions = asyncio.run(recover())
+    assert [s.key for s in sessions] == ["u/s"]
+    assert sessions[0].history.appended == 2
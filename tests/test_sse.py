@@ -0,0 +1,21 @@
+from app.ai.sse import SSEDecoder
+
+
+def test_events_split_across_chunks():
+    decoder = SSEDecoder()
+    events = decoder.feed("data: {\"a\"")
+    events += decoder.feed(": 1}\r")
+    events += decoder.feed("\n\r\ndata: [DONE]\n\n")
+    assert events == ['{"a": 1}', "[DONE]"]
+
+
+def test_multi_line_data_and_comments():
+    decoder = SSEDecoder()
+    assert decoder.feed(": keep-alive\ndata: one\ndata:two\nevent: x\n\n") == ["one\ntwo"]
+
+
+def test_flush_emits_an_unterminated_last_event():
+    decoder = SSEDecoder()
+    assert decoder.feed("data: first\n\ndata: last") == ["first"]
+    assert decoder.flush() == ["last"]
+    assert decoder.flush() == []